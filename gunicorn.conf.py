@@ -0,0 +1,7 @@
+# Loaded automatically by `gunicorn server:app` (see nixpacks.toml)
+
+
+def post_worker_init(worker):
+    # Snapshot restore and the snapshot/pre-warm schedulers run per worker, as with `python server.py`
+    from server import start_background_jobs
+    start_background_jobs()
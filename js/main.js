@@ -351,6 +351,7 @@
                         method: 'POST',
                         headers: { 'Content-Type': 'application/json' },
                         body: JSON.stringify({
+                            url: info.url,
                             title: info.title,
                             artist: info.artist,
                             duration: info.duration
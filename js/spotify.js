@@ -21,6 +21,36 @@ const Spotify = {
         }
     },
 
+    /**
+     * Info endpoint URL (compact columnar track list)
+     * @param {string} url - Spotify URL
+     * @returns {string} Request URL
+     */
+    infoUrl(url) {
+        return `${this.apiBase}/info?url=${encodeURIComponent(url)}&format=columnar`;
+    },
+
+    /**
+     * Expand a columnar track list back into track objects
+     * @param {object} info - Info response
+     * @returns {object} Info object with tracks as an array
+     */
+    decodeInfo(info) {
+        const columns = info.tracks;
+        if (!columns || Array.isArray(columns)) return info;
+
+        const tracks = [];
+        for (let i = 0; i < columns.count; i++) {
+            tracks.push({
+                title: columns.title[i],
+                artist: columns.artists[columns.artist[i]],
+                duration: columns.duration[i],
+                url: columns.url_prefix + columns.id[i]
+            });
+        }
+        return { ...info, tracks };
+    },
+
     /**
      * Get track/playlist info
      * @param {string} url - Spotify URL
@@ -28,12 +58,12 @@ const Spotify = {
      */
     async getInfo(url) {
         try {
-            const response = await fetch(`${this.apiBase}/info?url=${encodeURIComponent(url)}`);
+            const response = await fetch(this.infoUrl(url));
             if (!response.ok) {
                 const error = await response.json();
                 throw new Error(error.error || 'Data could not be fetched');
             }
-            return await response.json();
+            return this.decodeInfo(await response.json());
         } catch (error) {
             console.error('Spotify info error:', error);
             throw error;
@@ -65,14 +95,14 @@ const Spotify = {
             if (!info) {
                 this._log('logFetchingMetadata');
                 Utils.updateProgress(20, 'statusFetching');
-                const infoResponse = await fetch(`${this.apiBase}/info?url=${encodeURIComponent(url)}`);
+                const infoResponse = await fetch(this.infoUrl(url));
 
                 if (!infoResponse.ok) {
                     this._log('logErrorMetadata', true);
                     const error = await infoResponse.json();
                     throw new Error(error.error || Utils.t('logErrorMetadata'));
                 }
-                info = await infoResponse.json();
+                info = this.decodeInfo(await infoResponse.json());
             } else {
                 this._log('logCacheRead');
                 Utils.updateProgress(30, 'statusFetching');
@@ -186,14 +216,14 @@ const Spotify = {
         Utils.updateProgress(10, 'statusFetching');
 
         try {
-            const response = await fetch(`${this.apiBase}/info?url=${encodeURIComponent(url)}`);
+            const response = await fetch(this.infoUrl(url));
 
             if (!response.ok) {
                 const error = await response.json();
                 throw new Error(error.error || 'Playlist alına bilmədi');
             }
 
-            const info = await response.json();
+            const info = this.decodeInfo(await response.json());
 
             if (info.type === 'playlist' && info.tracks && info.tracks.length > 0) {
                 Utils.updateProgress(40, 'statusFetching');
@@ -256,6 +286,7 @@ const Spotify = {
                     method: 'POST',
                     headers: { 'Content-Type': 'application/json' },
                     body: JSON.stringify({
+                        url: track.url,
                         title: track.title,
                         artist: track.artist,
                         duration: track.duration
@@ -727,6 +727,7 @@ const Utils = {
                 method: 'POST',
                 headers: { 'Content-Type': 'application/json' },
                 body: JSON.stringify({
+                    url: track.url,
                     title: track.title,
                     artist: track.artist,
                     duration: track.duration
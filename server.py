@@ -3,7 +3,7 @@ SoundWave Backend Server
 Handles music downloads from Spotify via YouTube
 """
 
-from flask import Flask, request, jsonify, Response
+from flask import Flask, request, jsonify, Response, redirect, g
 from flask_cors import CORS
 import yt_dlp
 import sys
@@ -14,11 +14,35 @@ import threading
 import re
 import time
 import shutil
+import subprocess
+import mmap
+import hashlib
+import bisect
 import warnings
-from datetime import date
+import logging
+import logging.handlers
+import queue
+import random
+import atexit
+import signal
+import contextvars
+import cProfile
+import pstats
+import io
+import hmac
+import gzip
+import struct
+import sqlite3
+import marshal
+import math
+from datetime import date, datetime
+from contextlib import contextmanager, nullcontext
+from collections import OrderedDict, Counter
+from concurrent.futures import ThreadPoolExecutor, wait, as_completed, FIRST_COMPLETED, FIRST_EXCEPTION, TimeoutError as FuturesTimeout
 from unidecode import unidecode
 import json
 import requests
+import requests.adapters
 from dotenv import load_dotenv
 from youtubesearchpython import VideosSearch
 from ytmusicapi import YTMusic
@@ -45,9 +69,292 @@ try:
 except:
     FFMPEG_PATH = 'ffmpeg'
 
+# Brotli is optional - /api/info falls back to gzip without it
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Structured logging - records are handed to a queue on the request thread and written
+# to stdout by a background listener, so hot paths never block on console I/O.
+# Levels are configurable per subsystem (LOG_LEVEL_YTMUSIC=DEBUG, ...), DEBUG events
+# can be sampled, and every line carries the request/job ID that produced it.
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+LOG_FORMAT = os.environ.get('LOG_FORMAT', 'text')  # 'text' or 'json'
+LOG_DEBUG_SAMPLE_RATE = float(os.environ.get('LOG_DEBUG_SAMPLE_RATE', 1.0))  # Fraction of DEBUG records kept
+REQUEST_ID = contextvars.ContextVar('request_id', default='-')
+
+class RequestContextFilter(logging.Filter):
+    """Attach the current request/job ID and drop sampled-out DEBUG records."""
+
+    def filter(self, record):
+        if record.levelno <= logging.DEBUG and LOG_DEBUG_SAMPLE_RATE < 1.0:
+            if random.random() >= LOG_DEBUG_SAMPLE_RATE:
+                return False
+        record.request_id = REQUEST_ID.get()
+        record.subsystem = record.name.split('.', 1)[-1]
+        return True
+
+class StdoutHandler(logging.StreamHandler):
+    """Write to whatever sys.stdout is at emit time (it may be swapped, e.g. by test runners)."""
+
+    @property
+    def stream(self):
+        return sys.stdout
+
+    @stream.setter
+    def stream(self, value):
+        pass
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'ts': self.formatTime(record, '%Y-%m-%dT%H:%M:%S'),
+            'level': record.levelname,
+            'subsystem': record.subsystem,
+            'request_id': record.request_id,
+            'msg': record.getMessage()
+        }
+        entry.update(getattr(record, 'fields', {}))
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+def setup_logging():
+    if LOG_FORMAT == 'json':
+        formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter('%(asctime)s %(levelname)s [%(subsystem)s] req=%(request_id)s %(message)s')
+    
+    stream_handler = StdoutHandler()
+    stream_handler.setFormatter(formatter)
+    
+    log_queue = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    queue_handler.addFilter(RequestContextFilter())
+    
+    root = logging.getLogger('soundwave')
+    root.setLevel(LOG_LEVEL)
+    root.addHandler(queue_handler)
+    root.propagate = False
+    
+    listener = logging.handlers.QueueListener(log_queue, stream_handler)
+    listener.start()
+    atexit.register(listener.stop)
+
+def get_logger(subsystem):
+    """Logger for one subsystem; its level can be overridden with LOG_LEVEL_<SUBSYSTEM>."""
+    logger = logging.getLogger(f'soundwave.{subsystem}')
+    level = os.environ.get(f'LOG_LEVEL_{subsystem.upper()}')
+    if level:
+        logger.setLevel(level.upper())
+    return logger
+
+setup_logging()
+playlist_log = get_logger('Playlist')
+prefetch_log = get_logger('Prefetch')
+cluster_log = get_logger('Cluster')
+info_log = get_logger('Info')
+metadata_log = get_logger('Metadata')
+ytmusic_log = get_logger('YTMusic')
+match_log = get_logger('Match')
+preview_log = get_logger('Preview')
+stream_log = get_logger('Stream')
+research_log = get_logger('Research')
+download_log = get_logger('Download')
+
 app = Flask(__name__)
 CORS(app)
 
+@app.before_request
+def assign_request_id():
+    # Reuse the caller's ID (e.g. a forwarding peer) so one request can be traced across nodes
+    REQUEST_ID.set(request.headers.get('X-Request-ID') or uuid.uuid4().hex[:12])
+
+@app.after_request
+def expose_request_id(response):
+    response.headers['X-Request-ID'] = REQUEST_ID.get()
+    return response
+
+# Profiling and tracing (admin only). Send X-Admin-Token together with
+#   X-Profile: 1  -> cProfile the request, fetch it from /api/admin/profiles/<X-Profile-ID>
+#   X-Trace: 1    -> record spans, fetch Chrome trace JSON from /api/admin/traces/<X-Trace-ID>
+# or call /api/admin/sample?seconds=N for folded stacks of all threads.
+# When no trace is active, trace_span() is a single ContextVar lookup.
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN')  # Admin endpoints are disabled when unset
+PROFILES = OrderedDict()  # profile id -> {'path', 'stats', 'text'}
+TRACES = OrderedDict()  # trace id -> Chrome trace event list
+PROFILE_HISTORY = int(os.environ.get('PROFILE_HISTORY', 20))
+ACTIVE_TRACE = contextvars.ContextVar('active_trace', default=None)
+NO_SPAN = nullcontext()
+
+def is_admin_request():
+    token = request.headers.get('X-Admin-Token', '')
+    # Bytes, since compare_digest rejects non-ASCII str
+    return bool(ADMIN_TOKEN) and hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode())
+
+def remember(store, key, value):
+    store[key] = value
+    while len(store) > PROFILE_HISTORY:
+        store.popitem(last=False)
+
+def add_span(trace, name, start_ns, end_ns, args=None):
+    trace.append({
+        'name': name,
+        'ph': 'X',
+        'ts': start_ns // 1000,
+        'dur': (end_ns - start_ns) // 1000,
+        'pid': os.getpid(),
+        'tid': threading.get_ident(),
+        'args': args or {}
+    })
+
+@contextmanager
+def record_span(trace, name, args):
+    start = time.perf_counter_ns()
+    try:
+        yield
+    finally:
+        add_span(trace, name, start, time.perf_counter_ns(), args)
+
+def trace_span(name, **args):
+    """Time a phase of the current request if it is being traced (no-op otherwise)."""
+    trace = ACTIVE_TRACE.get()
+    if trace is None:
+        return NO_SPAN
+    return record_span(trace, name, args)
+
+@app.before_request
+def start_profiling():
+    ACTIVE_TRACE.set(None)  # Worker threads are reused - never inherit a previous request's trace
+    if not (request.headers.get('X-Profile') or request.headers.get('X-Trace')):
+        return None
+    if not is_admin_request():
+        return None
+    if request.headers.get('X-Trace'):
+        ACTIVE_TRACE.set([])
+    if request.headers.get('X-Profile'):
+        g.profiler = cProfile.Profile()
+        g.profiler.enable()
+    return None
+
+@app.after_request
+def finish_profiling(response):
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        profiler.disable()
+        text = io.StringIO()
+        pstats.Stats(profiler, stream=text).sort_stats('cumulative').print_stats(60)
+        profile_id = REQUEST_ID.get()
+        remember(PROFILES, profile_id, {'path': request.path, 'profiler': profiler, 'text': text.getvalue()})
+        response.headers['X-Profile-ID'] = profile_id
+    
+    trace = ACTIVE_TRACE.get()
+    if trace is not None:
+        ACTIVE_TRACE.set(None)
+        remember(TRACES, REQUEST_ID.get(), trace)
+        response.headers['X-Trace-ID'] = REQUEST_ID.get()
+    return response
+
+def add_ydl_trace_hooks(ydl_opts):
+    """Split a traced yt-dlp download into 'fetch' and per-postprocessor (FFmpeg) spans."""
+    trace = ACTIVE_TRACE.get()
+    if trace is None:
+        return ydl_opts
+    started = {}
+    
+    def on_progress(d):
+        if d['status'] == 'downloading':
+            started.setdefault('fetch', time.perf_counter_ns())
+        elif d['status'] == 'finished' and 'fetch' in started:
+            add_span(trace, 'ytdlp.fetch', started.pop('fetch'), time.perf_counter_ns(),
+                     {'bytes': d.get('total_bytes') or d.get('downloaded_bytes')})
+    
+    def on_postprocess(d):
+        name = f"ytdlp.{d.get('postprocessor', 'postprocess')}"
+        if d['status'] == 'started':
+            started[name] = time.perf_counter_ns()
+        elif d['status'] == 'finished' and name in started:
+            add_span(trace, name, started.pop(name), time.perf_counter_ns())
+    
+    return {**ydl_opts, 'progress_hooks': [on_progress], 'postprocessor_hooks': [on_postprocess]}
+
+def admin_only():
+    """Return an error response unless the request carries the admin token."""
+    if not ADMIN_TOKEN:
+        return jsonify({'error': 'Not found'}), 404
+    if not is_admin_request():
+        return jsonify({'error': 'Forbidden'}), 403
+    return None
+
+@app.route('/api/admin/profiles/<profile_id>', methods=['GET'])
+def get_profile(profile_id):
+    """cProfile output of a request: text (default) or a .prof file (?format=pstats) for snakeviz etc."""
+    denied = admin_only()
+    if denied:
+        return denied
+    entry = PROFILES.get(profile_id)
+    if not entry:
+        return jsonify({'error': 'Profile not found'}), 404
+    
+    if request.args.get('format') == 'pstats':
+        profiler = entry['profiler']
+        profiler.create_stats()
+        response = Response(marshal.dumps(profiler.stats), mimetype='application/octet-stream')
+        response.headers['Content-Disposition'] = f'attachment; filename="{profile_id}.prof"'
+        return response
+    return Response(f"{entry['path']}\n{entry['text']}", mimetype='text/plain')
+
+@app.route('/api/admin/traces/<trace_id>', methods=['GET'])
+def get_trace(trace_id):
+    """Spans of a traced request in Chrome trace event format (Perfetto, speedscope, chrome://tracing)."""
+    denied = admin_only()
+    if denied:
+        return denied
+    trace = TRACES.get(trace_id)
+    if trace is None:
+        return jsonify({'error': 'Trace not found'}), 404
+    return jsonify({'traceEvents': trace, 'displayTimeUnit': 'ms'})
+
+@app.route('/api/admin/sample', methods=['GET'])
+def sample_threads():
+    """
+    Sample the stacks of all threads for ?seconds=N (max 60) every ?interval_ms.
+    Returns folded stacks ("thread;frame;frame count"), the input format of flamegraph.pl/speedscope.
+    """
+    denied = admin_only()
+    if denied:
+        return denied
+    try:
+        seconds = float(request.args.get('seconds', 5))
+        interval_ms = float(request.args.get('interval_ms', 10))
+    except ValueError:
+        return jsonify({'error': 'seconds and interval_ms must be numbers'}), 400
+    if not (math.isfinite(seconds) and math.isfinite(interval_ms)) or seconds <= 0:
+        return jsonify({'error': 'seconds must be positive and interval_ms finite'}), 400
+    seconds = min(seconds, 60)
+    interval = max(interval_ms, 1) / 1000
+    
+    me = threading.get_ident()
+    counts = Counter()
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == me:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                frame = frame.f_back
+            stack.append(names.get(ident, str(ident)))
+            counts[';'.join(reversed(stack))] += 1
+        time.sleep(interval)
+    
+    folded = '\n'.join(f"{stack} {count}" for stack, count in counts.most_common())
+    return Response(folded + '\n', mimetype='text/plain')
+
 DOWNLOAD_DIR = os.path.join(tempfile.gettempdir(), 'soundwave_downloads')
 os.makedirs(DOWNLOAD_DIR, exist_ok=True)
 
@@ -61,6 +368,65 @@ STATS = {
     'last_reset': date.today().isoformat()
 }
 
+def env_flag(name, default=False):
+    """Read a boolean flag from the environment (1/true/yes/on)."""
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+# Match and metadata caches (in-memory, entries expire after CACHE_TTL seconds)
+CACHE_TTL = int(os.environ.get('CACHE_TTL', 6 * 3600))
+MATCH_CACHE = {}  # (artist, title) -> YouTube Music match from youtube_music_search
+MATCH_CACHE_STATS = {'hits': 0, 'misses': 0}  # find_youtube_match lookups, reported by /api/cluster
+METADATA_CACHE = {}  # Spotify track URL -> researched {'title', 'artist', 'duration'}
+CACHE_LOCK = threading.Lock()
+
+def match_cache_key(artist, title):
+    """Normalize artist/title so equivalent lookups share a cache entry."""
+    return (unidecode((artist or '').lower()).strip(), unidecode((title or '').lower()).strip())
+
+def cache_get(cache, key):
+    with CACHE_LOCK:
+        entry = cache.get(key)
+        if entry is None:
+            return None
+        if time.time() - entry['stored_at'] > CACHE_TTL:
+            del cache[key]
+            return None
+        return entry['value']
+
+def cache_put(cache, key, value):
+    with CACHE_LOCK:
+        cache[key] = {'value': value, 'stored_at': time.time()}
+
+def cache_evict(cache, key):
+    with CACHE_LOCK:
+        cache.pop(key, None)
+
+# Foreground activity - background work (prefetch) waits while user requests are running
+FOREGROUND = {'active': 0}
+FOREGROUND_IDLE = threading.Condition()
+
+@contextmanager
+def foreground_work():
+    """Mark a user-facing request as in progress for the duration of the block."""
+    with FOREGROUND_IDLE:
+        FOREGROUND['active'] += 1
+    try:
+        yield
+    finally:
+        with FOREGROUND_IDLE:
+            FOREGROUND['active'] -= 1
+            if FOREGROUND['active'] == 0:
+                FOREGROUND_IDLE.notify_all()
+
+def wait_for_foreground_idle(cancel_event, poll=1.0):
+    """Block until no foreground request is running (or the job is cancelled)."""
+    with FOREGROUND_IDLE:
+        while FOREGROUND['active'] > 0 and not cancel_event.is_set():
+            FOREGROUND_IDLE.wait(timeout=poll)
+
 @app.route('/api/health', methods=['GET'])
 def health_check():
     """Health check endpoint for server status."""
@@ -164,23 +530,366 @@ def get_playlist_tracks(playlist_id, url_type='playlist'):
                             'url': f"https://open.spotify.com/track/{track_id}"
                         })
                 
-                print(f"[Playlist] Extracted {len(tracks)} tracks")
+                playlist_log.info(f"Extracted {len(tracks)} tracks")
         
         # Fallback: Use oEmbed to get basic info
         if not tracks:
-            print(f"[Playlist] Embed scraping failed, trying alternative method...")
+            playlist_log.warning("Embed scraping failed, trying alternative method...")
             # For playlists, we can try the public oembed for the overall info
             # But individual tracks need a different approach
             
     except Exception as e:
-        print(f"[Playlist] Error fetching tracks: {e}")
+        playlist_log.error(f"Error fetching tracks: {e}")
     
     return tracks
 
+# Speculative prefetch - resolve YouTube matches for a listed playlist/album in the background
+# (opt-in via PREFETCH_ENABLED, so that selected tracks usually hit MATCH_CACHE)
+PREFETCH_ENABLED = env_flag('PREFETCH_ENABLED')
+PREFETCH_LIMIT = int(os.environ.get('PREFETCH_LIMIT', 10))  # First N tracks of each collection
+PREFETCH_METADATA = env_flag('PREFETCH_METADATA')  # Also research oEmbed metadata/duration
+PREFETCH_CONCURRENCY = int(os.environ.get('PREFETCH_CONCURRENCY', 2))  # Global limit across all jobs
+PREFETCH_SLOTS = threading.BoundedSemaphore(max(1, PREFETCH_CONCURRENCY))
+PREFETCH_JOBS = {}  # collection id -> cancel Event
+PREFETCH_LOCK = threading.Lock()
+
+def start_prefetch(collection_id, tracks):
+    """Start a low-priority prefetch job for the first PREFETCH_LIMIT tracks of a collection."""
+    if not PREFETCH_ENABLED or not tracks or PREFETCH_LIMIT <= 0:
+        return False
+    with PREFETCH_LOCK:
+        if collection_id in PREFETCH_JOBS:
+            return True  # Already running for this collection
+        cancel_event = threading.Event()
+        PREFETCH_JOBS[collection_id] = cancel_event
+    
+    worker = threading.Thread(
+        target=run_prefetch,
+        args=(collection_id, tracks[:PREFETCH_LIMIT], cancel_event),
+        daemon=True
+    )
+    worker.start()
+    prefetch_log.info(f"Started for {collection_id} ({min(len(tracks), PREFETCH_LIMIT)} tracks)")
+    return True
+
+def cancel_prefetch(collection_id):
+    """Cancel a running prefetch job. Returns True if a job was found."""
+    with PREFETCH_LOCK:
+        cancel_event = PREFETCH_JOBS.get(collection_id)
+    if cancel_event:
+        cancel_event.set()
+        with FOREGROUND_IDLE:
+            FOREGROUND_IDLE.notify_all()
+        return True
+    return False
+
+def run_prefetch(collection_id, tracks, cancel_event):
+    REQUEST_ID.set(f"prefetch-{collection_id}")
+    resolved = 0
+    try:
+        for track in tracks:
+            # Yield to foreground requests before taking a slot
+            wait_for_foreground_idle(cancel_event)
+            if cancel_event.is_set():
+                prefetch_log.info(f"Cancelled {collection_id} after {resolved} tracks")
+                return
+            with PREFETCH_SLOTS:
+                if prefetch_track(track):
+                    resolved += 1
+        prefetch_log.info(f"Finished {collection_id}: {resolved}/{len(tracks)} matches cached")
+    finally:
+        with PREFETCH_LOCK:
+            PREFETCH_JOBS.pop(collection_id, None)
+
+def prefetch_track(track):
+    """Resolve and cache the YouTube match (and optionally metadata) for one listed track."""
+    try:
+        title = track.get('title')
+        artist = track.get('artist')
+        if not title:
+            return False
+        
+        # Same key the frontend uses for /api/preview on playlist tracks
+        video = find_youtube_match(artist, title, track.get('duration'))
+        
+        # Same key /api/download uses after its research phase
+        if PREFETCH_METADATA and track.get('url'):
+            metadata = research_spotify_metadata(track['url'])
+            if metadata and match_cache_key(metadata['artist'], metadata['title']) != match_cache_key(artist, title):
+                find_youtube_match(metadata['artist'], metadata['title'], metadata['duration'])
+        
+        return video is not None
+    except Exception as e:
+        prefetch_log.error(f"Error on '{track.get('title')}': {e}")
+        return False
+
+@app.route('/api/prefetch/<collection_id>', methods=['DELETE'])
+def cancel_prefetch_job(collection_id):
+    """Cancel background prefetching for a playlist/album."""
+    return jsonify({'cancelled': cancel_prefetch(collection_id)})
+
+# Cluster mode - with several replicas, each Spotify track is owned by one node on a
+# consistent-hash ring so its caches are reused. Non-owners forward (or redirect)
+# /api/download and /api/preview to the owner.
+CLUSTER_SELF = os.environ.get('CLUSTER_SELF', '').rstrip('/')  # This node's base URL, e.g. http://10.0.0.1:5000
+CLUSTER_PEERS = os.environ.get('CLUSTER_PEERS', '')  # Comma-separated base URLs of all nodes (including self)
+CLUSTER_PEERS_FILE = os.environ.get('CLUSTER_PEERS_FILE')  # Or one base URL per line, reloaded on change
+CLUSTER_MODE = os.environ.get('CLUSTER_MODE', 'forward')  # 'forward' (proxy) or 'redirect' (307)
+CLUSTER_VNODES = int(os.environ.get('CLUSTER_VNODES', 100))
+CLUSTER_ROUTED_PATHS = ('/api/download', '/api/preview')
+CLUSTER_FORWARDED_HEADER = 'X-SoundWave-Forwarded'
+HOP_BY_HOP_HEADERS = {
+    'connection', 'keep-alive', 'proxy-authenticate', 'proxy-authorization',
+    'te', 'trailers', 'transfer-encoding', 'upgrade', 'host', 'content-length'
+}
+
+class HashRing:
+    """Consistent-hash ring with virtual nodes; adding/removing a peer only moves ~1/N of the keys."""
+
+    def __init__(self, nodes, vnodes=100):
+        self.nodes = sorted(set(nodes))
+        self.points = []
+        self.owners = {}
+        for node in self.nodes:
+            for i in range(vnodes):
+                point = self._hash(f"{node}#{i}")
+                self.points.append(point)
+                self.owners[point] = node
+        self.points.sort()
+
+    @staticmethod
+    def _hash(key):
+        return int(hashlib.md5(key.encode('utf-8')).hexdigest()[:16], 16)
+
+    def get(self, key):
+        if not self.points:
+            return None
+        index = bisect.bisect(self.points, self._hash(key)) % len(self.points)
+        return self.owners[self.points[index]]
+
+CLUSTER = {'ring': None, 'peers_mtime': None, 'local': 0, 'forwarded': 0, 'forward_errors': 0}
+CLUSTER_LOCK = threading.Lock()
+
+def parse_peer_list(text):
+    peers = []
+    for line in text.replace(',', '\n').splitlines():
+        peer = line.split('#', 1)[0].strip().rstrip('/')
+        if peer:
+            peers.append(peer)
+    return peers
+
+def get_cluster_ring():
+    """Return the current HashRing, or None when cluster mode is off."""
+    if not CLUSTER_SELF:
+        return None
+    
+    with CLUSTER_LOCK:
+        if CLUSTER_PEERS_FILE:
+            try:
+                mtime = os.path.getmtime(CLUSTER_PEERS_FILE)
+                if mtime != CLUSTER['peers_mtime']:
+                    with open(CLUSTER_PEERS_FILE, encoding='utf-8') as f:
+                        peers = parse_peer_list(f.read())
+                    CLUSTER['ring'] = HashRing(peers + [CLUSTER_SELF], CLUSTER_VNODES)
+                    CLUSTER['peers_mtime'] = mtime
+                    cluster_log.info(f"Loaded {len(CLUSTER['ring'].nodes)} nodes from {CLUSTER_PEERS_FILE}")
+            except OSError as e:
+                cluster_log.warning(f"Could not read peers file: {e}")
+        elif CLUSTER['ring'] is None:
+            CLUSTER['ring'] = HashRing(parse_peer_list(CLUSTER_PEERS) + [CLUSTER_SELF], CLUSTER_VNODES)
+        return CLUSTER['ring']
+
+def cluster_routing_key(data):
+    """Spotify track ID when the request has a URL, otherwise the normalized artist/title."""
+    url = data.get('url') or ''
+    track_id = extract_spotify_id(url, 'track') if url else None
+    if track_id:
+        return track_id
+    artist, title = match_cache_key(data.get('artist'), data.get('title'))
+    return f"{artist}|{title}"
+
+def forward_to_owner(owner):
+    """Proxy the current request to the owner node and stream its response back."""
+    headers = {k: v for k, v in request.headers.items() if k.lower() not in HOP_BY_HOP_HEADERS}
+    headers[CLUSTER_FORWARDED_HEADER] = CLUSTER_SELF
+    headers['X-Request-ID'] = REQUEST_ID.get()  # The owner logs under the same ID
+    upstream = requests.request(
+        request.method,
+        f"{owner}{request.full_path.rstrip('?')}",
+        headers=headers,
+        data=request.get_data(),
+        stream=True,
+        timeout=(3, 600)
+    )
+    
+    response_headers = [
+        (k, v) for k, v in upstream.headers.items()
+        if k.lower() not in HOP_BY_HOP_HEADERS and k.lower() != 'content-encoding'
+    ]
+    if upstream.headers.get('Content-Length') and not upstream.headers.get('Content-Encoding'):
+        response_headers.append(('Content-Length', upstream.headers['Content-Length']))
+    
+    def generate():
+        try:
+            for chunk in upstream.iter_content(8192):
+                yield chunk
+        finally:
+            upstream.close()
+    
+    return Response(generate(), status=upstream.status_code, headers=response_headers)
+
+@app.before_request
+def route_to_owner():
+    if request.path not in CLUSTER_ROUTED_PATHS or request.method != 'POST':
+        return None
+    if request.headers.get(CLUSTER_FORWARDED_HEADER):
+        return None  # Already routed by a peer - never forward twice
+    
+    ring = get_cluster_ring()
+    if ring is None:
+        return None
+    
+    owner = ring.get(cluster_routing_key(request.get_json(silent=True) or {}))
+    if owner is None or owner == CLUSTER_SELF:
+        CLUSTER['local'] += 1
+        return None
+    
+    if CLUSTER_MODE == 'redirect':
+        CLUSTER['forwarded'] += 1
+        return redirect(f"{owner}{request.full_path.rstrip('?')}", code=307)
+    
+    try:
+        response = forward_to_owner(owner)
+        CLUSTER['forwarded'] += 1
+        return response
+    except requests.RequestException as e:
+        # Owner unreachable - serve locally rather than failing the request
+        CLUSTER['forward_errors'] += 1
+        cluster_log.warning(f"Forward to {owner} failed: {e}, serving locally")
+        return None
+
+@app.route('/api/cluster', methods=['GET'])
+def cluster_status():
+    """Cluster membership and routing counters for this node."""
+    ring = get_cluster_ring()
+    return jsonify({
+        'enabled': ring is not None,
+        'self': CLUSTER_SELF or None,
+        'mode': CLUSTER_MODE,
+        'nodes': ring.nodes if ring else [],
+        'local': CLUSTER['local'],
+        'forwarded': CLUSTER['forwarded'],
+        'forward_errors': CLUSTER['forward_errors'],
+        'match_cache': dict(MATCH_CACHE_STATS)
+    })
+
 @app.route('/')
 def index():
     return jsonify({'status': 'ok', 'ffmpeg': FFMPEG_PATH})
 
+# /api/info responses - each payload is serialized once and kept per (url, format) for
+# INFO_CACHE_TTL seconds together with its gzip/brotli encodings, so repeat views of a
+# playlist skip both the scrape and the compression. The ETag is a hash of the JSON body
+# (suffixed with the content coding), and a matching If-None-Match gets an empty 304.
+# ?format=columnar returns the track list as parallel arrays with Spotify track IDs
+# instead of full URLs and artists deduplicated into a lookup table.
+INFO_CACHE_TTL = int(os.environ.get('INFO_CACHE_TTL', 300))
+INFO_CACHE_SIZE = int(os.environ.get('INFO_CACHE_SIZE', 200))
+INFO_MAX_AGE = int(os.environ.get('INFO_MAX_AGE', 60))  # Cache-Control max-age for browsers
+INFO_COMPRESS_MIN_BYTES = int(os.environ.get('INFO_COMPRESS_MIN_BYTES', 1024))
+INFO_CACHE = OrderedDict()  # (url, format) -> {'body', 'digest', 'encoded', 'prefetch', 'stored_at'}
+INFO_CACHE_LOCK = threading.Lock()
+SPOTIFY_TRACK_URL = 'https://open.spotify.com/track/'
+
+def columnar_tracks(tracks):
+    """[{'title', 'artist', 'duration', 'url'}, ...] -> parallel arrays (see js/spotify.js decodeInfo)."""
+    prefix = SPOTIFY_TRACK_URL if all(t['url'].startswith(SPOTIFY_TRACK_URL) for t in tracks) else ''
+    artists = {}
+    for track in tracks:
+        artists.setdefault(track['artist'], len(artists))
+    return {
+        'count': len(tracks),
+        'url_prefix': prefix,
+        'artists': list(artists),
+        'title': [t['title'] for t in tracks],
+        'artist': [artists[t['artist']] for t in tracks],
+        'duration': [t['duration'] for t in tracks],
+        'id': [t['url'][len(prefix):] for t in tracks]
+    }
+
+def make_info_entry(payload, prefetch=None):
+    """`prefetch` is the (collection id, tracks) to prefetch again whenever the entry is served."""
+    body = json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    return {
+        'body': body,
+        'digest': hashlib.sha1(body).hexdigest()[:20],
+        'encoded': {},
+        'prefetch': prefetch,
+        'stored_at': time.time()
+    }
+
+def info_cache_get(key):
+    with INFO_CACHE_LOCK:
+        entry = INFO_CACHE.get(key)
+        if entry is None:
+            return None
+        if time.time() - entry['stored_at'] > INFO_CACHE_TTL:
+            del INFO_CACHE[key]
+            return None
+        INFO_CACHE.move_to_end(key)
+        return entry
+
+def info_cache_put(key, entry):
+    with INFO_CACHE_LOCK:
+        INFO_CACHE[key] = entry
+        while len(INFO_CACHE) > INFO_CACHE_SIZE:
+            INFO_CACHE.popitem(last=False)
+    return entry
+
+def accepted_encoding():
+    """Preferred content coding from Accept-Encoding: 'br' (if brotli is installed), 'gzip' or None."""
+    weights = {}
+    for part in request.headers.get('Accept-Encoding', '').lower().split(','):
+        name, _, params = part.partition(';')
+        quality = re.search(r'q\s*=\s*([\d.]+)', params)
+        try:
+            weights[name.strip()] = float(quality.group(1)) if quality else 1.0
+        except ValueError:
+            weights[name.strip()] = 0.0
+    
+    for encoding in (['br'] if brotli else []) + ['gzip']:
+        if weights.get(encoding, weights.get('*', 0.0)) > 0:
+            return encoding
+    return None
+
+def send_info(entry, cacheable=True):
+    """
+    Serve a /api/info entry, compressed if the client allows it, or 304 if unchanged.
+    Entries that must not be cached (placeholders) get no-store and no ETag.
+    """
+    encoding = accepted_encoding() if len(entry['body']) >= INFO_COMPRESS_MIN_BYTES else None
+    headers = {'Cache-Control': 'no-store', 'Vary': 'Accept-Encoding'}
+    if cacheable:
+        etag = f"{entry['digest']}-{encoding}" if encoding else entry['digest']
+        headers['ETag'] = f'"{etag}"'
+        headers['Cache-Control'] = f'public, max-age={INFO_MAX_AGE}'
+        if etag in request.if_none_match:
+            return Response(status=304, headers=headers)
+    
+    if not encoding:
+        return Response(entry['body'], mimetype='application/json', headers=headers)
+    
+    body = entry['encoded'].get(encoding)
+    if body is None:
+        with trace_span('info.compress', encoding=encoding, bytes=len(entry['body'])):
+            if encoding == 'br':
+                body = brotli.compress(entry['body'], quality=9)
+            else:
+                body = gzip.compress(entry['body'], compresslevel=9)
+        entry['encoded'][encoding] = body
+    headers['Content-Encoding'] = encoding
+    return Response(body, mimetype='application/json', headers=headers)
+
 @app.route('/api/info', methods=['GET'])
 def get_info():
     url = request.args.get('url')
@@ -190,33 +899,45 @@ def get_info():
     if not is_spotify_url(url):
         return jsonify({'error': 'Yalnız Spotify linkləri dəstəklənir'}), 400
     
+    info_format = 'columnar' if request.args.get('format') == 'columnar' else 'rows'
+    cache_key = (url, info_format)
+    entry = info_cache_get(cache_key)
+    if entry is not None:
+        if entry['prefetch']:
+            start_prefetch(*entry['prefetch'])  # The last job may have finished or been cancelled
+        return send_info(entry)
+    
     url_type = get_spotify_url_type(url)
     
     # Handle playlists and albums
     if url_type in ['playlist', 'album']:
         spotify_id = extract_spotify_id(url, url_type)
         if spotify_id:
-            print(f"[Info] Detected {url_type}: {spotify_id}")
-            tracks = get_playlist_tracks(spotify_id, url_type)
+            info_log.info(f"Detected {url_type}: {spotify_id}")
+            with trace_span('get_playlist_tracks', type=url_type):
+                tracks = get_playlist_tracks(spotify_id, url_type)
             
             if tracks:
+                start_prefetch(spotify_id, tracks)
+                
                 # Get playlist/album title via oEmbed
                 try:
                     oembed_url = f"https://open.spotify.com/oembed?url={url}"
-                    oembed_resp = requests.get(oembed_url, timeout=5)
+                    with trace_span('oembed_title'):
+                        oembed_resp = requests.get(oembed_url, timeout=5)
                     title = 'Spotify Collection'
                     if oembed_resp.status_code == 200:
                         title = oembed_resp.json().get('title', 'Spotify Collection')
                 except:
                     title = 'Spotify Collection'
                 
-                return jsonify({
+                return send_info(info_cache_put(cache_key, make_info_entry({
                     'type': url_type,
                     'platform': 'spotify',
                     'title': title,
-                    'tracks': tracks,
+                    'tracks': columnar_tracks(tracks) if info_format == 'columnar' else tracks,
                     'url': url
-                })
+                }, prefetch=(spotify_id, tracks))))
             else:
                 # Fallback: return empty tracks list, frontend can handle
                 return jsonify({
@@ -230,14 +951,19 @@ def get_info():
     
     # Handle single tracks
     try:
-        return get_spotify_info(url, log_error=True)
+        info, resolved = get_spotify_info(url, log_error=True)
+        entry = make_info_entry(info)
+        # Placeholder titles are not cached, here or by clients - the next request retries the sources
+        if not resolved:
+            return send_info(entry, cacheable=False)
+        return send_info(info_cache_put(cache_key, entry))
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
 
-def scrape_spotify_duration(url):
-    """Try to extract duration from Spotify HTML meta tags or script data."""
+def scrape_spotify_page(url):
+    """Fetch the track page once and read its duration and ISRC (when the page exposes it)."""
     try:
         headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
@@ -245,26 +971,126 @@ def scrape_spotify_duration(url):
         }
         r = requests.get(url, headers=headers, timeout=5)
         if r.status_code != 200:
+            return {}
+        
+        isrc = re.search(r'"isrc"\s*:\s*"([A-Za-z]{2}[A-Za-z0-9]{3}\d{7})"', r.text)
+        return {
+            'duration': parse_duration_from_html(r.text),
+            'isrc': isrc.group(1).upper() if isrc else None
+        }
+    except:
+        return {}
+
+# Candidate search - several strategies are queried concurrently and their results are
+# validated as they arrive. The first candidate whose confidence (strategy weight x title
+# score) reaches SEARCH_ACCEPT_CONFIDENCE wins and the other strategies are abandoned.
+# The best valid candidate is also accepted as soon as no strategy still running could
+# beat it (its weight is the most it can score), e.g. a perfect ytmusic-videos match once
+# ytmusic-songs has answered, without waiting for the lower-weighted videos-search.
+# Each search gets its own threads: a blocking HTTP call can't be cancelled, so abandoned
+# strategies finish in the background without holding up other searches, and
+# SEARCH_TIMEOUT never includes time spent queued behind them.
+SEARCH_ACCEPT_CONFIDENCE = float(os.environ.get('SEARCH_ACCEPT_CONFIDENCE', 0.9))
+SEARCH_TIMEOUT = float(os.environ.get('SEARCH_TIMEOUT', 10))
+
+# Words that indicate non-original versions
+VERSION_FILTER_WORDS = ['remix', 'cover', 'live', 'club mix', 'acoustic', 'instrumental']
+
+def parse_duration_text(duration_text):
+    """'3:45' or '1:02:03' -> seconds."""
+    if not duration_text:
+        return None
+    try:
+        seconds = 0
+        for part in duration_text.split(':'):
+            seconds = seconds * 60 + int(part)
+        return seconds
+    except ValueError:
+        return None
+
+def search_ytmusic_songs(query):
+    with trace_span('ytmusic.search', filter='songs'):
+        return ytmusic.search(query=query, filter="songs", limit=5)
+
+def search_ytmusic_videos(query):
+    with trace_span('ytmusic.search', filter='videos'):
+        return ytmusic.search(query=query, filter="videos", limit=5)
+
+def search_youtube_videos(query):
+    """youtube-search-python backend, normalized to the ytmusicapi result shape."""
+    with trace_span('videos_search'):
+        results = VideosSearch(query, limit=5).result().get('result', [])
+    candidates = []
+    for video in results:
+        channel = (video.get('channel') or {}).get('name', '')
+        # "Artist - Topic" and "ArtistVEVO" channels carry the artist name
+        channel = re.sub(r'\s*-\s*Topic$|VEVO$', '', channel).strip()
+        candidates.append({
+            'videoId': video.get('id'),
+            'title': video.get('title', ''),
+            'artists': [{'name': channel}] if channel else [],
+            'duration': video.get('duration'),
+            'thumbnails': video.get('thumbnails') or []
+        })
+    return candidates
+
+# Strategies with the trust placed in their results (multiplied into the confidence)
+SEARCH_STRATEGIES = [
+    {'name': 'ytmusic-songs', 'weight': 1.0, 'search': search_ytmusic_songs},
+    {'name': 'ytmusic-videos', 'weight': 0.85, 'search': search_ytmusic_videos},
+    {'name': 'videos-search', 'weight': 0.75, 'search': search_youtube_videos},
+]
+
+def validate_candidate(song, artist, title, duration=None):
+    """
+    Triple validation: Artist match + Anti-Remix + Title similarity (+ duration when known).
+    Returns the title score (0-1) of a valid candidate, or None if it is rejected.
+    """
+    if not song.get('videoId'):
+        return None
+    
+    # Normalize Spotify artist for comparison
+    spotify_artist = (artist or '').lower().strip()
+    
+    # Get YouTube artist and title
+    yt_artists = song.get('artists') or []
+    yt_artist = yt_artists[0].get('name', '').lower().strip() if yt_artists else ''
+    yt_title = song.get('title', '')
+    
+    # CHECK A: Artist validation
+    if spotify_artist and yt_artist:
+        artist_match = (spotify_artist in yt_artist) or (yt_artist in spotify_artist)
+        if not artist_match:
+            ytmusic_log.debug("REJECT (artist mismatch): '%s' by '%s' != '%s'", yt_title, yt_artist, spotify_artist)
             return None
-            
-        # Try OG meta tag
-        match = re.search(r'<meta property="music:duration" content="(\d+)"', r.text)
-        if match:
-            return int(match.group(1)) # This is usually in seconds
-            
-        # Try JSON-LD or script data
-        match = re.search(r'"durationMS":(\d+)', r.text)
-        if match:
-            return int(match.group(1)) // 1000 # Convert MS to Seconds
-            
+    
+    # CHECK B: Anti-Remix filter (unless the Spotify title is such a version itself)
+    if not any(word in title.lower() for word in VERSION_FILTER_WORDS):
+        if any(word in yt_title.lower() for word in VERSION_FILTER_WORDS):
+            ytmusic_log.debug("REJECT (unwanted version): '%s'", yt_title)
+            return None
+    
+    # CHECK C: Title similarity
+    score = title_match_score(title, artist, yt_title)
+    if score < TITLE_MATCH_THRESHOLD:
+        ytmusic_log.debug("REJECT (title mismatch): '%s' != '%s'", yt_title, title)
         return None
-    except:
+    
+    # CHECK D: Duration (music videos with long intros/outros)
+    try:
+        expected = float(duration) if duration else None
+    except (TypeError, ValueError):
+        expected = None
+    if not is_duration_valid(expected, parse_duration_text(song.get('duration'))):
+        ytmusic_log.debug("REJECT (duration mismatch): '%s' %s != %ss", yt_title, song.get('duration'), duration)
         return None
+    
+    return score
 
-def youtube_music_search(artist, title):
+def youtube_music_search(artist, title, duration=None):
     """
-    Search YouTube Music using ytmusicapi.
-    Triple validation: Artist match + Anti-Remix + Title similarity.
+    Search YouTube Music (songs, then videos) and YouTube concurrently.
+    Every candidate goes through validate_candidate.
     Returns None if no valid match found (does NOT return wrong songs).
     """
     try:
@@ -274,93 +1100,263 @@ def youtube_music_search(artist, title):
         
         # Title first is more accurate for song searches
         query = f"{sanitized_title} {sanitized_artist}" if sanitized_artist else sanitized_title
-        print(f"[YTMusic] Searching: {query}")
+        ytmusic_log.info(f"Searching: {query}")
         
-        # Fetch 5 results for filtering
-        results = ytmusic.search(query=query, filter="songs", limit=5)
+        pool = ThreadPoolExecutor(max_workers=len(SEARCH_STRATEGIES), thread_name_prefix='search')
+        running = {
+            pool.submit(contextvars.copy_context().run, strategy['search'], query): strategy
+            for strategy in SEARCH_STRATEGIES
+        }
+        pending = dict(running)
+        best = None  # (confidence, strategy order, result order, song, strategy)
+        checked = 0
         
-        if not results or len(results) == 0:
-            print("[YTMusic] No results found")
-            return None
+        try:
+            for future in as_completed(running, timeout=SEARCH_TIMEOUT):
+                strategy = pending.pop(future)
+                try:
+                    results = future.result() or []
+                except Exception as e:
+                    ytmusic_log.warning(f"{strategy['name']} failed: {e}")
+                    continue
+                
+                for position, song in enumerate(results):
+                    checked += 1
+                    score = validate_candidate(song, artist, title, duration)
+                    if score is None:
+                        continue
+                    confidence = strategy['weight'] * score
+                    candidate = (confidence, -SEARCH_STRATEGIES.index(strategy), -position, song, strategy)
+                    if best is None or candidate[:3] > best[:3]:
+                        best = candidate
+                    if confidence >= SEARCH_ACCEPT_CONFIDENCE:
+                        break
+                
+                if best and best[0] >= SEARCH_ACCEPT_CONFIDENCE:
+                    break  # Early acceptance - don't wait for the slower strategies
+                if best and all(
+                    best[:3] > (s['weight'], -SEARCH_STRATEGIES.index(s), 0) for s in pending.values()
+                ):
+                    break  # Nothing still running can outrank it
+        except FuturesTimeout:
+            ytmusic_log.warning(f"Search timed out after {SEARCH_TIMEOUT}s, using what arrived")
+        finally:
+            pool.shutdown(wait=False)  # Strategies still running finish and exit on their own
         
-        # Normalize Spotify artist for comparison
-        spotify_artist = (artist or '').lower().strip()
+        if best is None:
+            # NO PANIC FALLBACK - if all results failed validation, return None
+            ytmusic_log.warning(f"All {checked} results failed validation - no match found")
+            return None
         
-        # Words that indicate non-original versions
-        filter_words = ['remix', 'cover', 'live', 'club mix', 'acoustic', 'instrumental']
+        confidence, _, _, song, strategy = best
+        video_id = song['videoId']
+        yt_artists = song.get('artists') or []
+        ytmusic_log.info(
+            "ACCEPTED: '%s' by '%s' via %s (confidence %.2f)",
+            song.get('title', ''), yt_artists[0].get('name', '') if yt_artists else '', strategy['name'], confidence,
+            extra={'fields': {'video_id': video_id, 'strategy': strategy['name'], 'confidence': round(confidence, 2)}}
+        )
         
-        # Check if Spotify title contains any of these words
-        title_lower = title.lower()
-        spotify_has_filter = any(word in title_lower for word in filter_words)
+        # Get thumbnail
+        thumbnail = None
+        if song.get('thumbnails') and len(song['thumbnails']) > 0:
+            thumbnail = song['thumbnails'][-1].get('url')
         
-        # Iterate through results - TRIPLE VALIDATION
-        for song in results:
-            video_id = song.get('videoId')
-            if not video_id:
-                continue
-            
-            # Get YouTube artist and title
-            yt_artists = song.get('artists', [])
-            yt_artist = yt_artists[0].get('name', '').lower().strip() if yt_artists else ''
-            yt_title = song.get('title', '')
-            yt_title_lower = yt_title.lower()
-            
-            # CHECK A: Artist validation
-            if spotify_artist and yt_artist:
-                artist_match = (spotify_artist in yt_artist) or (yt_artist in spotify_artist)
-                if not artist_match:
-                    print(f"[YTMusic] REJECT (artist mismatch): '{yt_title}' by '{yt_artist}' != '{spotify_artist}'")
-                    continue
-            
-            # CHECK B: Anti-Remix filter
-            if not spotify_has_filter:
-                yt_has_filter = any(word in yt_title_lower for word in filter_words)
-                if yt_has_filter:
-                    print(f"[YTMusic] REJECT (unwanted version): '{yt_title}'")
-                    continue
-            
-            # CHECK C: Title similarity (uses existing helper function)
-            if not is_title_accurate(title, artist, yt_title):
-                print(f"[YTMusic] REJECT (title mismatch): '{yt_title}' != '{title}'")
-                continue
-            
-            # PASSED ALL 3 CHECKS - use this result
-            print(f"[YTMusic] ACCEPTED: '{yt_title}' by '{yt_artist}'")
-            
-            # Get duration in seconds
-            duration_text = song.get('duration', '')
-            duration_seconds = None
-            if duration_text:
-                parts = duration_text.split(':')
-                if len(parts) == 2:
-                    duration_seconds = int(parts[0]) * 60 + int(parts[1])
-                elif len(parts) == 3:
-                    duration_seconds = int(parts[0]) * 3600 + int(parts[1]) * 60 + int(parts[2])
-            
-            # Get thumbnail
-            thumbnail = None
-            if song.get('thumbnails') and len(song['thumbnails']) > 0:
-                thumbnail = song['thumbnails'][-1].get('url')
-            
-            return {
-                'webpage_url': f"https://music.youtube.com/watch?v={video_id}",
-                'title': yt_title,
-                'artist': yt_artists[0].get('name', artist) if yt_artists else artist,
-                'duration': duration_seconds,
-                'thumbnail': thumbnail,
-                'channel': yt_artists[0].get('name', '') if yt_artists else ''
-            }
-        
-        # NO PANIC FALLBACK - if all results failed validation, return None
-        print("[YTMusic] All 5 results failed validation - no match found")
-        return None
+        return {
+            'webpage_url': f"https://music.youtube.com/watch?v={video_id}",
+            'title': song.get('title', ''),
+            'artist': yt_artists[0].get('name', artist) if yt_artists else artist,
+            'duration': parse_duration_text(song.get('duration')),
+            'thumbnail': thumbnail,
+            'channel': yt_artists[0].get('name', '') if yt_artists else ''
+        }
         
     except Exception as e:
-        print(f"[YTMusic] Error: {e}")
+        ytmusic_log.error(f"Error: {e}")
+        return None
+
+def find_youtube_match(artist, title, duration=None):
+    """youtube_music_search with MATCH_CACHE in front of it (misses are not cached)."""
+    key = match_cache_key(artist, title)
+    video = cache_get(MATCH_CACHE, key)
+    if video:
+        MATCH_CACHE_STATS['hits'] += 1
+        ytmusic_log.debug(f"Cache hit: {title}")
+        return video
+    
+    MATCH_CACHE_STATS['misses'] += 1
+    video = youtube_music_search(artist, title, duration)
+    if video:
+        cache_put(MATCH_CACHE, key, video)
+    return video
+
+# MPEG audio header tables for probe_mp3 (index by version/layer as parsed from the frame header)
+MPEG_BITRATES = {  # kbps, by (version is MPEG-1, layer)
+    (True, 1): [0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448],
+    (True, 2): [0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384],
+    (True, 3): [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    (False, 1): [0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256],
+    (False, 2): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+    (False, 3): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+MPEG_SAMPLE_RATES = {3: [44100, 48000, 32000], 2: [22050, 24000, 16000], 0: [11025, 12000, 8000]}
+
+def parse_mpeg_header(data, offset):
+    """Decode the 4-byte MPEG audio frame header at offset, or return None if it isn't one."""
+    if offset + 4 > len(data):
+        return None
+    b1, b2, b3 = data[offset + 1], data[offset + 2], data[offset + 3]
+    if data[offset] != 0xFF or (b1 & 0xE0) != 0xE0:
+        return None
+    
+    version = (b1 >> 3) & 3  # 0 = MPEG-2.5, 2 = MPEG-2, 3 = MPEG-1
+    layer = 4 - ((b1 >> 1) & 3)  # 1, 2 or 3
+    bitrate_index = b2 >> 4
+    sample_rate_index = (b2 >> 2) & 3
+    if version == 1 or layer == 4 or bitrate_index in (0, 15) or sample_rate_index == 3:
+        return None  # Reserved values (or free format, which we don't probe)
+    
+    mpeg1 = version == 3
+    bitrate = MPEG_BITRATES[(mpeg1, layer)][bitrate_index] * 1000
+    sample_rate = MPEG_SAMPLE_RATES[version][sample_rate_index]
+    padding = (b2 >> 1) & 1
+    
+    if layer == 1:
+        samples = 384
+        frame_length = (12 * bitrate // sample_rate + padding) * 4
+    else:
+        samples = 1152 if (layer == 2 or mpeg1) else 576
+        frame_length = samples // 8 * bitrate // sample_rate + padding
+    
+    return {
+        'mpeg1': mpeg1,
+        'layer': layer,
+        'mono': (b3 >> 6) == 3,
+        'bitrate': bitrate,
+        'sample_rate': sample_rate,
+        'samples': samples,
+        'frame_length': frame_length
+    }
+
+def skip_id3v2(data):
+    """Return the offset just past any ID3v2 tags at the start of the file."""
+    offset = 0
+    while data[offset:offset + 3] == b'ID3' and offset + 10 <= len(data):
+        size = 0
+        for byte in data[offset + 6:offset + 10]:
+            size = (size << 7) | (byte & 0x7F)  # Syncsafe integer
+        footer = 10 if data[offset + 5] & 0x10 else 0
+        offset += 10 + size + footer
+    return offset
+
+def probe_mp3(filepath):
+    """
+    Read duration/bitrate/sample rate of an MP3 without decoding it.
+    Uses the Xing/Info (+ LAME gapless info) or VBRI header when present, otherwise
+    walks the MPEG frame headers. The file is memory-mapped, so only the pages that
+    are touched get read. Returns None if the file isn't a readable MP3.
+    """
+    try:
+        with open(filepath, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            return probe_mp3_data(data)
+    except (OSError, ValueError):
+        return None
+
+def probe_mp3_data(data):
+    start = skip_id3v2(data)
+    
+    # Find the first frame: a valid header followed by another valid header
+    first = None
+    limit = min(len(data), start + 64 * 1024)
+    offset = start
+    while offset < limit:
+        offset = data.find(b'\xff', offset, limit)
+        if offset < 0:
+            break
+        header = parse_mpeg_header(data, offset)
+        if header and parse_mpeg_header(data, offset + header['frame_length']):
+            first = header
+            break
+        offset += 1
+    if first is None:
+        return None
+    
+    sample_rate = first['sample_rate']
+    audio_bytes = len(data) - offset
+    if data[-128:-125] == b'TAG':
+        audio_bytes -= 128  # ID3v1 tag at the end
+    
+    # Xing/Info tag sits after the side information of the first frame
+    if first['mpeg1']:
+        side_info = 17 if first['mono'] else 32
+    else:
+        side_info = 9 if first['mono'] else 17
+    xing = offset + 4 + side_info
+    tag = data[xing:xing + 4]
+    
+    frames = None
+    source = 'scan'
+    padding_samples = 0
+    if tag in (b'Xing', b'Info'):
+        flags = int.from_bytes(data[xing + 4:xing + 8], 'big')
+        position = xing + 8
+        if flags & 1:
+            frames = int.from_bytes(data[position:position + 4], 'big')
+            position += 4
+        if flags & 2:
+            audio_bytes = int.from_bytes(data[position:position + 4], 'big')
+            position += 4
+        position += (100 if flags & 4 else 0) + (4 if flags & 8 else 0)
+        if data[position:position + 4] in (b'LAME', b'Lavc', b'Lavf'):
+            # LAME extension (also written by FFmpeg): encoder delay and padding, 12 bits each
+            gapless = data[position + 21:position + 24]
+            if len(gapless) == 3:
+                padding_samples = (gapless[0] << 4 | gapless[1] >> 4) + ((gapless[1] & 0x0F) << 8 | gapless[2])
+        source = 'xing'
+    elif data[offset + 36:offset + 40] == b'VBRI':
+        vbri = offset + 36
+        audio_bytes = int.from_bytes(data[vbri + 10:vbri + 14], 'big')
+        frames = int.from_bytes(data[vbri + 14:vbri + 18], 'big')
+        source = 'vbri'
+    
+    if frames:
+        samples = frames * first['samples'] - padding_samples
+    else:
+        # No usable tag - walk the frame headers and count samples
+        samples = 0
+        frames = 0
+        position = offset
+        end = len(data)
+        while position < end:
+            header = parse_mpeg_header(data, position)
+            if header is None or header['frame_length'] <= 0:
+                break
+            samples += header['samples']
+            frames += 1
+            position += header['frame_length']
+        source = 'scan'
+        if frames == 0:
+            return None
+    
+    duration_us = samples * 1_000_000 // sample_rate
+    if duration_us <= 0:
         return None
+    
+    return {
+        'duration_us': duration_us,
+        'bitrate': int(audio_bytes * 8 * 1_000_000 // duration_us),
+        'sample_rate': sample_rate,
+        'frames': frames,
+        'source': source
+    }
 
 def get_file_duration(filepath):
-    """Get duration of a media file using ffprobe (via yt-dlp)."""
+    """Get duration of a media file in seconds (header probe for MP3, yt-dlp otherwise)."""
+    if filepath.lower().endswith('.mp3'):
+        probe = probe_mp3(filepath)
+        if probe:
+            return probe['duration_us'] / 1_000_000
+    
     try:
         ydl_opts = {'quiet': True, 'no_warnings': True}
         with yt_dlp.YoutubeDL(ydl_opts) as ydl:
@@ -375,10 +1371,12 @@ def is_duration_valid(expected, actual, threshold=15):
         return True # Can't validate, assume OK
     return abs(expected - actual) <= threshold
 
-def is_title_accurate(target_title, target_artist, found_title):
-    """Check if the found title is a reasonable match for target title/artist."""
+TITLE_MATCH_THRESHOLD = 0.25
+
+def title_match_score(target_title, target_artist, found_title):
+    """How well the found title matches target title/artist, from 0 to 1."""
     if not found_title:
-        return True
+        return 1.0
     
     # Normalize everything using unidecode to handle special characters (e, o, u, s, etc.)
     found_title_norm = unidecode(found_title.lower())
@@ -395,196 +1393,381 @@ def is_title_accurate(target_title, target_artist, found_title):
         words = [w for w in cleaned.split() if w not in noise_words and len(w) > 1]
         return words
 
-    # 0. If it's the exact same normalized, True
+    # 0. If it's the exact same normalized, full match
     if target_title_norm == found_title_norm:
-        return True
+        return 1.0
         
     # 1. Simple inclusion check
     if target_title_norm in found_title_norm:
         # If artist is generic, we trust the title
         if target_artist_norm in ["spotify", "unknown", ""]:
-            return True
+            return 1.0
         # If artist is specified, check for at least some overlap
         artist_words = clean_text(target_artist_norm)
         if not artist_words or any(w in found_title_norm for w in artist_words):
-            return True
+            return 1.0
             
     # 2. Advanced Keyword overlap
     target_words = clean_text(target_title_norm)
     
     if not target_words:
-        return True # Can't validate if we have no words
+        return 1.0 # Can't validate if we have no words
         
     found_words = set(clean_text(found_title_norm))
     match_count = sum(1 for w in target_words if w in found_words or w in found_title_norm)
     
-    # Threshold: Significantly lower for better reliability
+    # Threshold (TITLE_MATCH_THRESHOLD): Significantly lower for better reliability
     # If more than 25% of the target title's significant words match, it's likely okay
     match_ratio = match_count / len(target_words)
-    print(f"[Match] Ratio: {match_ratio:.2f}, Target: '{target_title_norm}', Found: '{found_title_norm}'")
+    match_log.debug("Ratio: %.2f, Target: '%s', Found: '%s'", match_ratio, target_title_norm, found_title_norm,
+                    extra={'fields': {'ratio': round(match_ratio, 2)}})
     
-    if match_ratio >= 0.25:
-        return True
-        
-    return False
+    return match_ratio
 
-def get_spotify_info(url, log_error=False):
-    # Method 1: Spotify oEmbed API (Official, Reliable, No blocking)
-    try:
-        oembed_url = f"https://open.spotify.com/oembed?url={url}"
-        response = requests.get(oembed_url, timeout=5)
-        
-        if response.status_code == 200:
-            data = response.json()
-            full_title = data.get('title', '')
-            thumbnail = data.get('thumbnail_url', '')
-            
-            title = 'Spotify Track'
-            artist = data.get('author_name', 'Spotify')
-            if not artist or artist.startswith('http'):
-                artist = 'Spotify'
-            
-            # Parse "Song by Artist"
-            if ' by ' in full_title:
-                parts = full_title.rsplit(' by ', 1)
-                title = parts[0]
-                # Only use parsed artist if author_name is generic
-                if artist == 'Spotify':
-                    artist = parts[1]
-            else:
-                title = full_title
-                
-            # If artist is still 'Spotify', try to scrape from HTML meta tags with multiple UAs
-            if artist == 'Spotify' or artist == 'Unknown':
-                uas = [
-                    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-                    'facebookexternalhit/1.1',
-                    'Mozilla/5.0 (compatible; Googlebot/2.1; +http://www.google.com/bot.html)'
-                ]
-                
-                for ua in uas:
-                    try:
-                        og_res = requests.get(url, headers={'User-Agent': ua}, timeout=5)
-                        if og_res.status_code == 200:
-                            html_text = og_res.text
-                            
-                            # 1. Try specific meta tags
-                            tags = [
-                                r'<meta property="twitter:audio:artist_name" content="([^"]+)"',
-                                r'<meta property="music:musician" content="([^"]+)"',
-                                r'<meta name="music:musician" content="([^"]+)"',
-                                r'<meta name="twitter:creator" content="([^"]+)"'
-                            ]
-                            for tag in tags:
-                                match = re.search(tag, html_text)
-                                if match:
-                                    val = match.group(1).strip()
-                                    # Reject URLs or obviously wrong names
-                                    if val and val not in ['Spotify', 'Unknown'] and not val.startswith('http') and len(val) < 100:
-                                        artist = val
-                                        break
-                            
-                            if artist != 'Spotify' and artist != 'Unknown': break
-                            
-                            # 2. Try og:description (Artist · Song · Year)
-                            desc = re.search(r'<meta property="og:description" content="([^"]+)"', html_text)
-                            if not desc:
-                                desc = re.search(r'<meta name="description" content="([^"]+)"', html_text)
-                                
-                            if desc:
-                                desc_text = desc.group(1)
-                                if " · " in desc_text:
-                                    # Format: "[Artist] · Song · [Year]"
-                                    desc_parts = desc_text.split(" · ")
-                                    artist_candidate = desc_parts[0]
-                                    if "Listen to " in artist_candidate:
-                                        # Sometimes it's "Listen to [Song] on Spotify. [Artist] · ...."
-                                        if "on Spotify. " in artist_candidate:
-                                            artist_candidate = artist_candidate.split("on Spotify. ")[-1]
-                                    if artist_candidate not in ['Spotify', 'Unknown']:
-                                        artist = artist_candidate
-                                        break
-                                        
-                            # 3. Try HTML title tag parsing
-                            page_title = re.search(r'<title>([^<]+)</title>', html_text)
-                            if page_title:
-                                title_text = page_title.group(1).replace(" | Spotify", "").replace(" - Single", "")
-                                if " by " in title_text:
-                                    artist_candidate = title_text.split(" by ")[-1].strip()
-                                    if artist_candidate not in ['Spotify', 'Unknown']:
-                                        artist = artist_candidate
-                                        break
-                                elif " - " in title_text:
-                                    artist_candidate = title_text.split(" - ")[0].strip()
-                                    if artist_candidate not in ['Spotify', 'Unknown']:
-                                        artist = artist_candidate
-                                        break
-                    except:
-                        continue
-            
-            # Final cleanup: If we have "Title - Artist" in the title, and artist is Spotify
-            if artist == 'Spotify' and " - " in title:
-                # Sometimes oEmbed puts both in the title but doesn't set author_name
-                parts = title.split(" - ", 1)
-                title = parts[0]
-                artist = parts[1]
-            
-            print(f"[oEmbed] Success: {title} by {artist}")
-            
-            # Scrape duration separately as oEmbed doesn't have it
-            duration = scrape_spotify_duration(url)
-            
-            return jsonify({
-                'type': 'track',
-                'platform': 'spotify',
-                'title': title,
-                'artist': artist,
-                'thumbnail': thumbnail,
-                'duration': duration,
-                'url': url
-            })
-    except Exception as e:
-        if log_error:
-            print(f"[oEmbed] Error: {e}")
+# Metadata sources for get_spotify_info. They used to run strictly one after another
+# (oEmbed -> 3 UA page scrapes -> yt-dlp); now they are raced with hedging delays and
+# merged field by field. Each source is skipped while its circuit breaker is open.
+METADATA_DEADLINE = float(os.environ.get('METADATA_DEADLINE', 8))  # Seconds before returning what we have
+METADATA_HEDGE_DELAY = float(os.environ.get('METADATA_HEDGE_DELAY', 1.0))  # Stagger between fallback sources
+METADATA_REQUIRED_FIELDS = ('title', 'artist', 'duration')
+METADATA_EXECUTOR = ThreadPoolExecutor(
+    max_workers=int(os.environ.get('METADATA_WORKERS', 8)),
+    thread_name_prefix='metadata'
+)
 
-    # Method 2: Fallback to yt-dlp (Dump JSON)
-    try:
-        ydl_opts = {
-            'quiet': True, 
-            'no_warnings': True, 
-            'extract_flat': True,
-        }
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(url, download=False)
-            
-        title = info.get('title')
-        artist = info.get('artist') or info.get('uploader') or 'Spotify'
-        
-        if title and title != "Spotify":
-             duration = info.get('duration') or scrape_spotify_duration(url)
-             return jsonify({
-                'type': 'track',
-                'platform': 'spotify',
-                'title': title,
-                'artist': artist,
-                'thumbnail': info.get('thumbnail'),
-                'duration': duration,
-                'url': url
-            })
-    except:
-        pass
+PAGE_USER_AGENTS = [
+    'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+    'facebookexternalhit/1.1',
+    'Mozilla/5.0 (compatible; Googlebot/2.1; +http://www.google.com/bot.html)'
+]
+
+class CircuitBreaker:
+    """
+    Skip a source after `threshold` consecutive failures.
+    After `cooldown` seconds a single trial call is let through (half-open).
+    """
+
+    def __init__(self, name, threshold=3, cooldown=60):
+        self.name = name
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+        self.lock = threading.Lock()
+
+    def allow(self):
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            if time.time() - self.opened_at >= self.cooldown and not self.trial_running:
+                self.trial_running = True
+                return True
+            return False
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_running = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            self.trial_running = False
+            if self.failures >= self.threshold:
+                if self.opened_at is None:
+                    metadata_log.warning("Breaker for %s opened after %d failures", self.name, self.failures)
+                self.opened_at = time.time()
+
+def is_source_outage(error):
+    """
+    Whether a source error means the source itself is down: a timeout, connection error or
+    5xx. A 4xx (e.g. a made-up track ID) says nothing about the source and must not trip it.
+    """
+    seen = set()
+    while error is not None and id(error) not in seen:
+        seen.add(id(error))
+        if isinstance(error, (requests.Timeout, requests.ConnectionError, TimeoutError, ConnectionError)):
+            return True
+        if isinstance(error, requests.HTTPError):
+            return error.response is not None and error.response.status_code >= 500
+        if isinstance(error, yt_dlp.networking.exceptions.HTTPError):
+            return error.status >= 500
+        if isinstance(error, yt_dlp.networking.exceptions.TransportError):
+            return True
+        # yt-dlp wraps the network error: DownloadError -> ExtractorError -> cause
+        exc_info = getattr(error, 'exc_info', None)
+        error = getattr(error, 'cause', None) or (exc_info[1] if exc_info else None) or error.__cause__
+    return False
+
+def breaker_outcome(breaker):
+    """Record one call's success/failure on the breaker - only the first report counts."""
+    reported = threading.Lock()
+    
+    def record(ok):
+        if not reported.acquire(blocking=False):
+            return
+        if ok:
+            breaker.record_success()
+        else:
+            breaker.record_failure()
+    return record
+
+def is_generic_artist(value):
+    return not value or value in ['Spotify', 'Unknown'] or value.startswith('http')
+
+def parse_artist_from_html(html_text):
+    """Find the artist name in a Spotify track page (meta tags, description, <title>)."""
+    # 1. Try specific meta tags
+    tags = [
+        r'<meta property="twitter:audio:artist_name" content="([^"]+)"',
+        r'<meta property="music:musician" content="([^"]+)"',
+        r'<meta name="music:musician" content="([^"]+)"',
+        r'<meta name="twitter:creator" content="([^"]+)"'
+    ]
+    for tag in tags:
+        match = re.search(tag, html_text)
+        if match:
+            val = match.group(1).strip()
+            # Reject URLs or obviously wrong names
+            if not is_generic_artist(val) and len(val) < 100:
+                return val
+    
+    # 2. Try og:description (Artist · Song · Year)
+    desc = re.search(r'<meta property="og:description" content="([^"]+)"', html_text)
+    if not desc:
+        desc = re.search(r'<meta name="description" content="([^"]+)"', html_text)
+    
+    if desc:
+        desc_text = desc.group(1)
+        if " · " in desc_text:
+            # Format: "[Artist] · Song · [Year]"
+            artist_candidate = desc_text.split(" · ")[0]
+            if "Listen to " in artist_candidate:
+                # Sometimes it's "Listen to [Song] on Spotify. [Artist] · ...."
+                if "on Spotify. " in artist_candidate:
+                    artist_candidate = artist_candidate.split("on Spotify. ")[-1]
+            if artist_candidate not in ['Spotify', 'Unknown']:
+                return artist_candidate
+    
+    # 3. Try HTML title tag parsing
+    page_title = re.search(r'<title>([^<]+)</title>', html_text)
+    if page_title:
+        title_text = page_title.group(1).replace(" | Spotify", "").replace(" - Single", "")
+        if " by " in title_text:
+            artist_candidate = title_text.split(" by ")[-1].strip()
+        elif " - " in title_text:
+            artist_candidate = title_text.split(" - ")[0].strip()
+        else:
+            artist_candidate = None
+        if artist_candidate and artist_candidate not in ['Spotify', 'Unknown']:
+            return artist_candidate
+    
+    return None
+
+def parse_duration_from_html(html_text):
+    # Try OG meta tag (seconds)
+    match = re.search(r'<meta property="music:duration" content="(\d+)"', html_text)
+    if match:
+        return int(match.group(1))
+    # Try JSON-LD or script data (milliseconds)
+    match = re.search(r'"durationMS":(\d+)', html_text)
+    if match:
+        return int(match.group(1)) // 1000
+    return None
+
+def fetch_oembed_fields(url):
+    """Spotify oEmbed API (official, reliable): title, thumbnail and usually artist."""
+    oembed_url = f"https://open.spotify.com/oembed?url={url}"
+    response = requests.get(oembed_url, timeout=5)
+    response.raise_for_status()
+    
+    data = response.json()
+    full_title = data.get('title', '')
+    artist = data.get('author_name', '')
+    
+    # Parse "Song by Artist"
+    if ' by ' in full_title:
+        title, title_artist = full_title.rsplit(' by ', 1)
+        # Only use parsed artist if author_name is generic
+        if is_generic_artist(artist):
+            artist = title_artist
+    else:
+        title = full_title
+    
+    return {
+        'title': title or None,
+        'artist': None if is_generic_artist(artist) else artist,
+        'thumbnail': data.get('thumbnail_url') or None
+    }
+
+def fetch_page_fields(url, user_agent):
+    """Scrape the track page itself: artist from meta tags and duration."""
+    headers = {'User-Agent': user_agent, 'Accept-Language': 'en-US,en;q=0.9'}
+    response = requests.get(url, headers=headers, timeout=5)
+    response.raise_for_status()
+    return {
+        'artist': parse_artist_from_html(response.text),
+        'duration': parse_duration_from_html(response.text)
+    }
+
+def fetch_ytdlp_fields(url):
+    """Fallback to yt-dlp (dump JSON, flat extraction)."""
+    ydl_opts = {
+        'quiet': True,
+        'no_warnings': True,
+        'extract_flat': True,
+    }
+    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        info = ydl.extract_info(url, download=False)
+    
+    title = info.get('title')
+    artist = info.get('artist') or info.get('uploader')
+    return {
+        'title': title if title != 'Spotify' else None,
+        'artist': None if is_generic_artist(artist) else artist,
+        'duration': info.get('duration'),
+        'thumbnail': info.get('thumbnail')
+    }
+
+# Sources in priority order - for each field, the value from the earliest source wins.
+# `delay` is the hedging delay (in units of METADATA_HEDGE_DELAY) before a source is started.
+METADATA_SOURCES = [
+    {'name': 'oembed', 'delay': 0, 'fields': ('title', 'artist', 'thumbnail'),
+     'fetch': fetch_oembed_fields},
+    {'name': 'page-chrome', 'delay': 0, 'fields': ('artist', 'duration'),
+     'fetch': lambda url: fetch_page_fields(url, PAGE_USER_AGENTS[0])},
+    {'name': 'page-facebook', 'delay': 1, 'fields': ('artist', 'duration'),
+     'fetch': lambda url: fetch_page_fields(url, PAGE_USER_AGENTS[1])},
+    {'name': 'ytdlp', 'delay': 1.5, 'fields': ('title', 'artist', 'duration', 'thumbnail'),
+     'fetch': fetch_ytdlp_fields},
+    {'name': 'page-googlebot', 'delay': 2, 'fields': ('artist', 'duration'),
+     'fetch': lambda url: fetch_page_fields(url, PAGE_USER_AGENTS[2])},
+]
+METADATA_BREAKERS = {
+    source['name']: CircuitBreaker(
+        source['name'],
+        threshold=int(os.environ.get('BREAKER_THRESHOLD', 3)),
+        cooldown=float(os.environ.get('BREAKER_COOLDOWN', 60))
+    )
+    for source in METADATA_SOURCES
+}
+
+def resolve_spotify_metadata(url, required=METADATA_REQUIRED_FIELDS, deadline=None):
+    """
+    Race the metadata sources for a track URL and merge their results field by field.
+    Returns as soon as every required field is settled, i.e. filled by a source with
+    no higher-priority source for that field still running, or at the deadline.
+    """
+    deadline = METADATA_DEADLINE if deadline is None else deadline
+    start = time.monotonic()
+    
+    waiting = list(enumerate(METADATA_SOURCES))  # (rank, source) not started yet
+    done = set()  # ranks that finished, failed or were skipped
+    running = {}  # future -> (rank, source)
+    outcomes = {}  # future -> outcome recorder for the source's breaker
+    merged = {}  # field -> (rank, value, source name)
+    
+    def is_settled(field):
+        if field not in merged:
+            return False
+        best_rank = merged[field][0]
+        return all(
+            rank in done
+            for rank, source in enumerate(METADATA_SOURCES)
+            if rank < best_rank and field in source['fields']
+        )
+    
+    def run_source(source, url):
+        with trace_span(f"source:{source['name']}"):
+            return source['fetch'](url)
+    
+    def launch(rank, source):
+        # The breaker is only consulted for sources that are really started, so a
+        # half-open trial is never granted to a source that then doesn't run
+        breaker = METADATA_BREAKERS[source['name']]
+        if not breaker.allow():
+            done.add(rank)
+            return
+        # copy_context() keeps the request ID on log lines written by the worker thread
+        future = METADATA_EXECUTOR.submit(contextvars.copy_context().run, run_source, source, url)
+        running[future] = (rank, source)
+        outcomes[future] = record = breaker_outcome(breaker)
+        # Counted when the source finishes, even if this request has moved on by then
+        future.add_done_callback(lambda f: record(not is_source_outage(f.exception())))
+    
+    while True:
+        elapsed = time.monotonic() - start
+        if all(is_settled(field) for field in required):
+            break
         
-    # Panic fallback: Just get duration if everything else failed but we want to return SOMETHING
-    duration = scrape_spotify_duration(url)
+        # Start every source whose hedge delay has passed. If nothing is in flight
+        # there is no point waiting out the delay, so start the next one right away.
+        while waiting and (waiting[0][1]['delay'] * METADATA_HEDGE_DELAY <= elapsed or not running):
+            launch(*waiting.pop(0))
         
-    return jsonify({
+        if all(is_settled(field) for field in required):
+            break
+        if not running or elapsed >= deadline:
+            break
+        
+        timeout = deadline - elapsed
+        if waiting:
+            timeout = min(timeout, waiting[0][1]['delay'] * METADATA_HEDGE_DELAY - elapsed)
+        finished, _ = wait(running, timeout=max(timeout, 0), return_when=FIRST_COMPLETED)
+        
+        for future in finished:
+            rank, source = running.pop(future)
+            done.add(rank)
+            try:
+                result = future.result()
+            except Exception as e:
+                metadata_log.warning(f"{source['name']} failed: {e}")
+                continue
+            
+            for field in source['fields']:
+                value = result.get(field)
+                if value and (field not in merged or rank < merged[field][0]):
+                    merged[field] = (rank, value, source['name'])
+    
+    # Sources still in flight finish in the background; their results are dropped.
+    # Hitting the deadline counts as a failure for them, so a hanging source gets tripped.
+    if time.monotonic() - start >= deadline:
+        for future, (rank, source) in running.items():
+            metadata_log.warning(f"{source['name']} timed out after {deadline}s")
+            outcomes[future](False)
+    
+    metadata = {field: value for field, (rank, value, name) in merged.items()}
+    sources = sorted({name for rank, value, name in merged.values()})
+    metadata_log.info(f"Resolved {sorted(metadata)} in {time.monotonic() - start:.2f}s from {sources}")
+    return metadata
+
+def get_spotify_info(url, log_error=False):
+    """Track info for /api/info, and whether a source actually returned a title."""
+    with trace_span('resolve_metadata'):
+        metadata = resolve_spotify_metadata(url)
+    
+    title = metadata.get('title') or 'Spotify Track'
+    artist = metadata.get('artist') or 'Spotify'
+    
+    # Final cleanup: If we have "Title - Artist" in the title, and artist is Spotify
+    if artist == 'Spotify' and " - " in title:
+        # Sometimes oEmbed puts both in the title but doesn't set author_name
+        title, artist = title.split(" - ", 1)
+    
+    if log_error and not metadata.get('title'):
+        metadata_log.warning(f"No source returned a title for {url}")
+    
+    return {
         'type': 'track',
         'platform': 'spotify',
-        'title': 'Spotify Track',
-        'artist': 'Spotify',
-        'duration': duration,
+        'title': title,
+        'artist': artist,
+        'thumbnail': metadata.get('thumbnail'),
+        'duration': metadata.get('duration'),
         'url': url
-    })
+    }, bool(metadata.get('title'))
 
 @app.route('/api/preview', methods=['POST'])
 def preview_track():
@@ -596,11 +1779,23 @@ def preview_track():
     if not title:
         return jsonify({'error': 'Title required'}), 400
     
-    print(f"[Preview] Searching YouTube Music: {artist} - {title}")
+    preview_log.info(f"Searching YouTube Music: {artist} - {title}")
     
     try:
+        # A recording already resolved for any alias of this track skips the search.
+        # The ISRC is only used if the metadata is already cached - no extra request here.
+        recording_key, video = None, None
+        spotify_id = extract_spotify_id(data.get('url') or '', 'track')
+        if spotify_id:
+            metadata = cache_get(METADATA_CACHE, data['url']) or {}
+            recording_key, video = resolve_identity(spotify_id, metadata.get('isrc'), artist, title, data.get('duration'))
+        
         # Search YouTube Music (official audio tracks only)
-        video = youtube_music_search(artist, title)
+        if not video:
+            with foreground_work():
+                video = find_youtube_match(artist, title, data.get('duration'))
+            if video and recording_key:
+                store_recording_match(recording_key, video)
         
         if not video:
             return jsonify({'error': 'No results found on YouTube Music'}), 404
@@ -610,7 +1805,7 @@ def preview_track():
         youtube_duration = video.get('duration')
         channel = video.get('channel') or video.get('artist', '')
         
-        print(f"[Preview] Found: {youtube_title} ({channel})")
+        preview_log.info(f"Found: {youtube_title} ({channel})")
         
         return jsonify({
             'success': True,
@@ -622,7 +1817,7 @@ def preview_track():
         })
                 
     except Exception as e:
-        print(f"[Preview] Error: {e}")
+        preview_log.error(f"Error: {e}")
         return jsonify({'error': str(e)}), 500
 
 
@@ -638,7 +1833,7 @@ def stream_audio():
     if not youtube_url:
         return jsonify({'error': 'YouTube URL required'}), 400
     
-    print(f"[Stream] Preparing audio stream for: {youtube_url}")
+    stream_log.info(f"Preparing audio stream for: {youtube_url}")
     
     try:
         ydl_opts = {
@@ -663,7 +1858,7 @@ def stream_audio():
             else:
                 return jsonify({'error': 'Could not extract audio URL'}), 404
             
-            print(f"[Stream] Returning audio stream URL")
+            stream_log.info("Returning audio stream URL")
             return jsonify({
                 'success': True,
                 'audio_url': audio_url,
@@ -672,10 +1867,12 @@ def stream_audio():
             })
             
     except Exception as e:
-        print(f"[Stream] Error: {e}")
+        stream_log.error(f"Error: {e}")
         return jsonify({'error': str(e)}), 500
 
 
+AUDIO_QUALITIES = ('128', '192', '320')  # MP3 bitrates (kbps) offered by the frontend
+
 @app.route('/api/download', methods=['POST'])
 def download_track():
     data = request.get_json()
@@ -686,21 +1883,822 @@ def download_track():
     artist = data.get('artist')
     duration = data.get('duration') # Get duration from frontend
     youtube_url = data.get('youtube_url')  # YouTube URL from preview
-    quality = data.get('quality', '320')  # Audio quality (128, 192, 320)
+    quality = str(data.get('quality', '320'))  # Audio quality (128, 192, 320)
     
     if not url:
         return jsonify({'error': 'URL tələb olunur'}), 400
     
     if not is_spotify_url(url):
         return jsonify({'error': 'Yalnız Spotify linkləri dəstəklənir'}), 400
+    
+    # Checked before counting, so junk values never reach the popularity sketch
+    if quality not in AUDIO_QUALITIES:
+        return jsonify({'error': 'Keyfiyyət yalnız 128, 192 və ya 320 ola bilər'}), 400
         
+    record_popularity(url, quality, title, artist)
+    
     try:
-        return download_spotify(url, title, artist, duration, youtube_url, quality)
+        with foreground_work():
+            return download_spotify(url, title, artist, duration, youtube_url, quality)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
 
+def research_spotify_metadata(url):
+    """
+    Fetch fresh title/artist/duration for a track from its own Spotify page.
+    Results are kept in METADATA_CACHE. Returns None if oEmbed failed.
+    """
+    cached = cache_get(METADATA_CACHE, url)
+    if cached:
+        return cached
+    
+    try:
+        oembed_url = f"https://open.spotify.com/oembed?url={url}"
+        oembed_resp = requests.get(oembed_url, timeout=5)
+        if oembed_resp.status_code != 200:
+            return None
+        
+        data = oembed_resp.json()
+        full_title = data.get('title', '')
+        author = data.get('author_name', '')
+        
+        if ' by ' in full_title:
+            parts = full_title.rsplit(' by ', 1)
+            title = parts[0]
+            artist = author if author and author != 'Spotify' else parts[1]
+        else:
+            title = full_title
+            artist = author if author and author != 'Spotify' else None
+        
+        page = scrape_spotify_page(url)
+        metadata = {
+            'title': title,
+            'artist': artist,
+            'duration': page.get('duration'),
+            'isrc': page.get('isrc')
+        }
+        cache_put(METADATA_CACHE, url, metadata)
+        return metadata
+    except Exception as e:
+        research_log.warning(f"oEmbed failed: {e}, using passed metadata")
+        return None
+
+# Identity index - the same recording is published under many Spotify track IDs (single,
+# album, compilations, regional releases). The SQLite index links every Spotify ID to a
+# recording key (ISRC when the Spotify page exposes it, otherwise normalized
+# artist/title/duration) and each recording to the YouTube match chosen for it, so all
+# aliases share one resolution and one file in the audio cache.
+DATA_DIR = os.environ.get('SOUNDWAVE_DATA_DIR', os.path.join(tempfile.gettempdir(), 'soundwave_data'))
+os.makedirs(DATA_DIR, exist_ok=True)
+IDENTITY_DB_PATH = os.environ.get('IDENTITY_DB_PATH', os.path.join(DATA_DIR, 'identity.sqlite3'))
+IDENTITY_LOCAL = threading.local()  # One SQLite connection per thread
+identity_log = get_logger('Identity')
+
+def identity_db():
+    conn = getattr(IDENTITY_LOCAL, 'conn', None)
+    if conn is None:
+        conn = sqlite3.connect(IDENTITY_DB_PATH, timeout=10)
+        conn.execute('PRAGMA journal_mode=WAL')
+        IDENTITY_LOCAL.conn = conn
+    return conn
+
+def init_identity_db():
+    try:
+        with identity_db() as conn:
+            conn.execute('''CREATE TABLE IF NOT EXISTS tracks (
+                spotify_id TEXT PRIMARY KEY,
+                recording_key TEXT NOT NULL,
+                isrc TEXT,
+                artist TEXT,
+                title TEXT,
+                duration INTEGER,
+                updated_at REAL
+            )''')
+            conn.execute('CREATE INDEX IF NOT EXISTS tracks_recording ON tracks (recording_key)')
+            conn.execute('''CREATE TABLE IF NOT EXISTS recordings (
+                recording_key TEXT PRIMARY KEY,
+                video_id TEXT,
+                match_json TEXT NOT NULL,
+                updated_at REAL
+            )''')
+    except sqlite3.Error as e:
+        identity_log.error(f"Could not open {IDENTITY_DB_PATH}: {e}")
+
+def recording_key_for(isrc, artist, title, duration):
+    """ISRC when known, otherwise normalized artist/title with the duration rounded to 5 s."""
+    if isrc:
+        return f"isrc:{isrc.upper()}"
+    if is_generic_artist(artist) or not title:
+        return None
+    norm_artist, norm_title = (re.sub(r'[^a-z0-9]+', ' ', part).strip() for part in match_cache_key(artist, title))
+    bucket = int(round(float(duration) / 5)) * 5 if duration else 0
+    return f"meta:{norm_artist}|{norm_title}|{bucket}"
+
+def youtube_video_id(youtube_url):
+    match = re.search(r'(?:v=|youtu\.be/)([\w-]{11})', youtube_url or '')
+    return match.group(1) if match else None
+
+def resolve_identity(spotify_id, isrc=None, artist=None, title=None, duration=None):
+    """
+    Link a Spotify track ID to its recording and return (recording_key, match).
+    match is the YouTube match already chosen for any alias of the recording, or None.
+    """
+    try:
+        with identity_db() as conn:
+            row = conn.execute(
+                'SELECT recording_key, isrc FROM tracks WHERE spotify_id = ?', (spotify_id,)
+            ).fetchone()
+            recording_key = row[0] if row else None
+            
+            # First sighting, or an ISRC turned up for a track linked by metadata
+            if not row or (isrc and not row[1]):
+                recording_key = recording_key_for(isrc, artist, title, duration)
+                if not recording_key:
+                    return None, None
+                conn.execute(
+                    'INSERT OR REPLACE INTO tracks VALUES (?, ?, ?, ?, ?, ?, ?)',
+                    (spotify_id, recording_key, isrc, artist, title, duration, time.time())
+                )
+                if row and row[0] != recording_key:
+                    # Carry over the resolution made under the old metadata key
+                    conn.execute(
+                        'INSERT OR IGNORE INTO recordings SELECT ?, video_id, match_json, updated_at '
+                        'FROM recordings WHERE recording_key = ?', (recording_key, row[0])
+                    )
+            
+            match_row = conn.execute(
+                'SELECT match_json FROM recordings WHERE recording_key = ?', (recording_key,)
+            ).fetchone()
+        return recording_key, json.loads(match_row[0]) if match_row else None
+    except sqlite3.Error as e:
+        identity_log.error(f"Lookup failed for {spotify_id}: {e}")
+        return None, None
+
+def store_recording_match(recording_key, match):
+    try:
+        with identity_db() as conn:
+            conn.execute(
+                'INSERT OR REPLACE INTO recordings VALUES (?, ?, ?, ?)',
+                (recording_key, youtube_video_id(match.get('webpage_url')), json.dumps(match), time.time())
+            )
+        identity_log.info(f"Indexed {recording_key} -> {match.get('webpage_url')}")
+    except sqlite3.Error as e:
+        identity_log.error(f"Could not store {recording_key}: {e}")
+
+def forget_recording_match(recording_key):
+    """Drop a wrong match, including copies under the recording's older metadata key."""
+    try:
+        with identity_db() as conn:
+            conn.execute(
+                'DELETE FROM recordings WHERE recording_key = ? OR video_id = '
+                '(SELECT video_id FROM recordings WHERE recording_key = ?)', (recording_key, recording_key)
+            )
+    except sqlite3.Error as e:
+        identity_log.error(f"Could not forget {recording_key}: {e}")
+
+init_identity_db()
+
+# Audio cache - converted MP3s keyed by YouTube video ID and quality, shared by all
+# Spotify aliases of a recording. Least recently used files go first when over the limit.
+AUDIO_CACHE_DIR = os.path.join(DATA_DIR, 'audio')
+AUDIO_CACHE_MAX_MB = int(os.environ.get('AUDIO_CACHE_MAX_MB', 500))  # 0 disables the cache
+os.makedirs(AUDIO_CACHE_DIR, exist_ok=True)
+
+def audio_cache_path(youtube_url, quality):
+    video_id = youtube_video_id(youtube_url)
+    if AUDIO_CACHE_MAX_MB <= 0 or not video_id:
+        return None
+    return os.path.join(AUDIO_CACHE_DIR, f"{video_id}_{quality}.mp3")
+
+def store_in_audio_cache(filepath, cache_path):
+    """Move a finished MP3 into the cache (atomically) and evict old entries over the limit."""
+    staging_path = f"{cache_path}.{uuid.uuid4().hex[:8]}.tmp"
+    shutil.move(filepath, staging_path)
+    os.replace(staging_path, cache_path)
+    
+    entries = []
+    for name in os.listdir(AUDIO_CACHE_DIR):
+        path = os.path.join(AUDIO_CACHE_DIR, name)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+    
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= AUDIO_CACHE_MAX_MB * 1024 * 1024:
+            break
+        if path == cache_path:
+            continue
+        try:
+            os.remove(path)
+            total -= size
+        except OSError:
+            pass
+
+# Segmented download engine (DOWNLOAD_ENGINE=segmented) - the audio stream is fetched as
+# parallel byte ranges over pooled connections into a preallocated file, working around
+# per-connection throttling. FFmpeg is fed the contiguous completed prefix through a pipe,
+# so transcoding runs while later segments are still downloading.
+DOWNLOAD_ENGINE = os.environ.get('DOWNLOAD_ENGINE', 'ytdlp')  # 'ytdlp' or 'segmented'
+SEGMENT_SIZE = int(os.environ.get('SEGMENT_SIZE', 1024 * 1024))
+SEGMENT_CONCURRENCY = int(os.environ.get('SEGMENT_CONCURRENCY', 4))
+SEGMENT_RETRIES = int(os.environ.get('SEGMENT_RETRIES', 3))
+
+class SegmentedUnsupported(Exception):
+    """The stream can't be fetched by byte ranges (fragmented/live/unknown size)."""
+
+def resolve_audio_stream(youtube_url):
+    """Direct URL, request headers and size of the best audio format."""
+    ydl_opts = {'format': 'bestaudio/best', 'quiet': True, 'no_warnings': True, 'noplaylist': True}
+    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
+        info = ydl.extract_info(youtube_url, download=False)
+    
+    if info.get('protocol') not in ('http', 'https') or info.get('fragments') or not info.get('url'):
+        raise SegmentedUnsupported(f"protocol {info.get('protocol')}")
+    size = info.get('filesize')
+    headers = info.get('http_headers') or {}
+    if not size:
+        probe = requests.get(info['url'], headers={**headers, 'Range': 'bytes=0-0'}, timeout=10)
+        content_range = probe.headers.get('Content-Range', '')
+        if probe.status_code != 206 or '/' not in content_range:
+            raise SegmentedUnsupported('server does not support ranges')
+        size = int(content_range.rsplit('/', 1)[1])
+    return info['url'], headers, size
+
+def fetch_segment(session, stream_url, headers, fd, start, end, cancel):
+    """
+    Download bytes start..end (inclusive) into the file at the same offset, with retries.
+    Gives up as soon as `cancel` is set (another segment failed the download).
+    """
+    for attempt in range(SEGMENT_RETRIES + 1):
+        try:
+            response = session.get(
+                stream_url, headers={**headers, 'Range': f'bytes={start}-{end}'}, stream=True, timeout=(5, 30)
+            )
+            if response.status_code != 206:
+                raise requests.RequestException(f"HTTP {response.status_code} for range {start}-{end}")
+            offset = start
+            for chunk in response.iter_content(64 * 1024):
+                if cancel.is_set():
+                    raise requests.RequestException('download cancelled')
+                os.pwrite(fd, chunk, offset)
+                offset += len(chunk)
+            if offset != end + 1:
+                raise requests.RequestException(f"short read {offset - start}/{end - start + 1}")
+            return
+        except requests.RequestException as e:
+            if attempt == SEGMENT_RETRIES or cancel.is_set():
+                raise
+            download_log.debug("Segment %d-%d retry %d: %s", start, end, attempt + 1, e)
+            if cancel.wait(0.5 * 2 ** attempt):  # Backoff, cut short by cancellation
+                raise
+
+def ffmpeg_to_mp3_args(source, output_path, quality):
+    return [
+        FFMPEG_PATH, '-hide_banner', '-loglevel', 'error', '-y',
+        '-i', source, '-vn', '-codec:a', 'libmp3lame', '-b:a', f'{quality}k', output_path
+    ]
+
+def segmented_download(youtube_url, output_path, quality='320'):
+    """Fetch youtube_url's audio in parallel ranges and transcode it to output_path (MP3)."""
+    with trace_span('segmented.resolve'):
+        stream_url, headers, size = resolve_audio_stream(youtube_url)
+    
+    part_path = f"{output_path}.part"
+    segments = [(start, min(start + SEGMENT_SIZE, size) - 1) for start in range(0, size, SEGMENT_SIZE)]
+    done = [threading.Event() for _ in segments]
+    failed = threading.Event()
+    ffmpeg = feeder = None
+    ffmpeg_errors = tempfile.TemporaryFile()  # Not a pipe - nobody reads it while FFmpeg runs
+    completed = False
+    
+    fd = os.open(part_path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        os.ftruncate(fd, size)  # Preallocate
+        
+        # Transcode the completed prefix while the rest downloads
+        ffmpeg = subprocess.Popen(
+            ffmpeg_to_mp3_args('pipe:0', output_path, quality),
+            stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=ffmpeg_errors
+        )
+        
+        def feed_ffmpeg():
+            try:
+                for (start, end), event in zip(segments, done):
+                    while not event.wait(0.5):
+                        if failed.is_set():
+                            return
+                    ffmpeg.stdin.write(os.pread(fd, end - start + 1, start))
+            except (BrokenPipeError, OSError):
+                pass  # FFmpeg gave up - handled by the whole-file fallback below
+            finally:
+                try:
+                    ffmpeg.stdin.close()
+                except OSError:
+                    pass
+        
+        feeder = threading.Thread(target=feed_ffmpeg, daemon=True)
+        feeder.start()
+        
+        session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=SEGMENT_CONCURRENCY)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        
+        def run_segment(index):
+            start, end = segments[index]
+            fetch_segment(session, stream_url, headers, fd, start, end, cancel=failed)
+            done[index].set()
+        
+        # Segments are queued in order so the prefix FFmpeg needs completes first
+        pool = ThreadPoolExecutor(max_workers=SEGMENT_CONCURRENCY, thread_name_prefix='segment')
+        try:
+            with trace_span('segmented.fetch', bytes=size, segments=len(segments)):
+                futures = [pool.submit(contextvars.copy_context().run, run_segment, i) for i in range(len(segments))]
+                finished, _ = wait(futures, return_when=FIRST_EXCEPTION)
+                for future in finished:
+                    future.result()
+        except Exception:
+            failed.set()  # Segments still retrying stop at their next attempt
+            raise
+        finally:
+            # Queued segments are dropped; only the ones in flight are waited for
+            pool.shutdown(wait=True, cancel_futures=True)
+            session.close()
+        
+        with trace_span('segmented.ffmpeg_tail'):
+            feeder.join()
+            ffmpeg.wait()
+        ffmpeg_errors.seek(0)
+        errors = ffmpeg_errors.read().decode(errors='ignore').strip()
+        
+        if ffmpeg.returncode != 0 or errors:
+            # Some containers (MP4 with a trailing moov) can't be demuxed from a pipe, and FFmpeg
+            # may still exit 0 for them - transcode the finished file instead
+            download_log.warning(f"Streaming transcode failed ({errors[:200]}), retrying from file")
+            with trace_span('segmented.ffmpeg_file'):
+                subprocess.run(ffmpeg_to_mp3_args(part_path, output_path, quality), check=True, capture_output=True)
+        completed = True
+    finally:
+        # Nothing may touch fd once it is closed - stop FFmpeg and the feeder first
+        failed.set()
+        if ffmpeg is not None and ffmpeg.poll() is None:
+            ffmpeg.kill()
+        if feeder is not None:
+            feeder.join()
+        if ffmpeg is not None:
+            ffmpeg.wait()
+        ffmpeg_errors.close()
+        os.close(fd)
+        for path in (part_path,) if completed else (part_path, output_path):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+    
+    download_log.info(f"Segmented download: {size // 1024} KB in {len(segments)} segments")
+
+def download_audio(youtube_url, ydl_opts, output_dir, title, quality='320'):
+    """Download and convert youtube_url to '<title>.mp3' in output_dir with the configured engine."""
+    if DOWNLOAD_ENGINE == 'segmented':
+        try:
+            segmented_download(youtube_url, os.path.join(output_dir, f'{title}.mp3'), quality)
+            return
+        except Exception as e:
+            download_log.warning(f"Segmented download failed ({e}), falling back to yt-dlp")
+            for name in os.listdir(output_dir):
+                try:
+                    os.remove(os.path.join(output_dir, name))
+                except OSError:
+                    pass
+    
+    with trace_span('ytdlp.download'), yt_dlp.YoutubeDL(add_ydl_trace_hooks(ydl_opts)) as ydl:
+        ydl.download([youtube_url])
+
+def fetch_into_audio_cache(youtube_url, quality='320'):
+    """Download and convert a YouTube track straight into the audio cache (background warm-up)."""
+    cache_path = audio_cache_path(youtube_url, quality)
+    if not cache_path or os.path.exists(cache_path):
+        return cache_path
+    
+    work_dir = os.path.join(DOWNLOAD_DIR, f"warm_{uuid.uuid4().hex[:8]}")
+    os.makedirs(work_dir, exist_ok=True)
+    ydl_opts = {
+        'format': 'bestaudio/best',
+        'outtmpl': os.path.join(work_dir, 'track.%(ext)s'),
+        'noplaylist': True,
+        'quiet': True,
+        'ffmpeg_location': FFMPEG_PATH,
+        'postprocessors': [{
+            'key': 'FFmpegExtractAudio',
+            'preferredcodec': 'mp3',
+            'preferredquality': str(quality),
+        }],
+    }
+    try:
+        download_audio(youtube_url, ydl_opts, work_dir, 'track', quality)
+        store_in_audio_cache(os.path.join(work_dir, 'track.mp3'), cache_path)
+        return cache_path
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+# Cache snapshots - Railway disks are ephemeral, so a fresh deploy starts cold. A snapshot
+# holds the metadata/match caches, the identity index and the list of hot audio files.
+# Format: SNAPSHOT_MAGIC | version (uint16) | sha256 of payload | gzip(JSON payload).
+SNAPSHOT_MAGIC = b'SWSNAP'
+SNAPSHOT_VERSION = 1
+SNAPSHOT_PATH = os.environ.get('SNAPSHOT_PATH', os.path.join(DATA_DIR, 'cache.swsnap'))
+SNAPSHOT_INTERVAL = int(os.environ.get('SNAPSHOT_INTERVAL', 0))  # Seconds between scheduled snapshots, 0 = off
+SNAPSHOT_ON_SHUTDOWN = env_flag('SNAPSHOT_ON_SHUTDOWN', True)
+SNAPSHOT_HOT_AUDIO = int(os.environ.get('SNAPSHOT_HOT_AUDIO', 50))  # Most recently used audio files to list
+SNAPSHOT_REWARM_AUDIO = int(os.environ.get('SNAPSHOT_REWARM_AUDIO', 0))  # How many of them to re-download on restore
+SNAPSHOT_LOCK = threading.Lock()
+snapshot_log = get_logger('Snapshot')
+
+def export_snapshot():
+    """Serialize caches, identity index and hot audio list into a snapshot archive (bytes)."""
+    with CACHE_LOCK:
+        match_cache = [[list(key), entry] for key, entry in MATCH_CACHE.items()]
+        metadata_cache = [[key, entry] for key, entry in METADATA_CACHE.items()]
+    
+    tracks, recordings = [], []
+    try:
+        conn = identity_db()
+        tracks = conn.execute('SELECT * FROM tracks').fetchall()
+        recordings = conn.execute('SELECT * FROM recordings').fetchall()
+    except sqlite3.Error as e:
+        snapshot_log.warning(f"Identity index not included: {e}")
+    
+    hot_audio = []
+    try:
+        for name in os.listdir(AUDIO_CACHE_DIR):
+            match = re.fullmatch(r'([\w-]{11})_(\d+)\.mp3', name)
+            if match:
+                stat = os.stat(os.path.join(AUDIO_CACHE_DIR, name))
+                hot_audio.append({
+                    'video_id': match.group(1),
+                    'quality': match.group(2),
+                    'size': stat.st_size,
+                    'last_used': stat.st_mtime
+                })
+    except OSError:
+        pass
+    hot_audio.sort(key=lambda entry: entry['last_used'], reverse=True)
+    
+    payload = gzip.compress(json.dumps({
+        'created_at': time.time(),
+        'match_cache': match_cache,
+        'metadata_cache': metadata_cache,
+        'tracks': tracks,
+        'recordings': recordings,
+        'hot_audio': hot_audio[:SNAPSHOT_HOT_AUDIO],
+        'popularity': export_popularity()
+    }, separators=(',', ':')).encode('utf-8'))
+    
+    return SNAPSHOT_MAGIC + struct.pack('>H', SNAPSHOT_VERSION) + hashlib.sha256(payload).digest() + payload
+
+def import_snapshot(archive):
+    """
+    Verify and load a snapshot archive. Entries already present (newer) are kept.
+    Returns the hot audio list from the snapshot. Raises ValueError for a bad archive.
+    """
+    header_size = len(SNAPSHOT_MAGIC) + 2 + 32
+    if len(archive) < header_size or not archive.startswith(SNAPSHOT_MAGIC):
+        raise ValueError('Not a SoundWave snapshot')
+    version, = struct.unpack('>H', archive[len(SNAPSHOT_MAGIC):len(SNAPSHOT_MAGIC) + 2])
+    if version != SNAPSHOT_VERSION:
+        raise ValueError(f'Unsupported snapshot version {version}')
+    checksum, payload = archive[len(SNAPSHOT_MAGIC) + 2:header_size], archive[header_size:]
+    if not hmac.compare_digest(hashlib.sha256(payload).digest(), checksum):
+        raise ValueError('Snapshot checksum mismatch')
+    data = json.loads(gzip.decompress(payload))
+    
+    now = time.time()
+    with CACHE_LOCK:
+        for key, entry in data['match_cache']:
+            if now - entry['stored_at'] <= CACHE_TTL:
+                MATCH_CACHE.setdefault(tuple(key), entry)
+        for key, entry in data['metadata_cache']:
+            if now - entry['stored_at'] <= CACHE_TTL:
+                METADATA_CACHE.setdefault(key, entry)
+    
+    try:
+        with identity_db() as conn:
+            conn.executemany('INSERT OR IGNORE INTO tracks VALUES (?, ?, ?, ?, ?, ?, ?)', data['tracks'])
+            conn.executemany('INSERT OR IGNORE INTO recordings VALUES (?, ?, ?, ?)', data['recordings'])
+    except sqlite3.Error as e:
+        snapshot_log.warning(f"Identity index not restored: {e}")
+    
+    if data.get('popularity'):
+        import_popularity(data['popularity'])
+    
+    snapshot_log.info(
+        f"Restored {len(data['match_cache'])} matches, {len(data['metadata_cache'])} metadata entries, "
+        f"{len(data['tracks'])} indexed tracks from snapshot of {date.fromtimestamp(data['created_at'])}"
+    )
+    return data['hot_audio']
+
+def save_snapshot():
+    """Write a snapshot to SNAPSHOT_PATH (atomically)."""
+    with SNAPSHOT_LOCK:
+        try:
+            archive = export_snapshot()
+            # Unique per writer - every gunicorn worker saves to the same SNAPSHOT_PATH
+            temp_path = f"{SNAPSHOT_PATH}.{os.getpid()}.{uuid.uuid4().hex[:8]}.tmp"
+            try:
+                with open(temp_path, 'wb') as f:
+                    f.write(archive)
+                os.replace(temp_path, SNAPSHOT_PATH)
+            except OSError:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+                raise
+            snapshot_log.info(f"Saved {len(archive)} bytes to {SNAPSHOT_PATH}")
+        except Exception as e:
+            snapshot_log.error(f"Save failed: {e}")
+
+def rewarm_audio(hot_audio):
+    """Re-download the hottest audio files of a restored snapshot, yielding to user requests."""
+    idle = threading.Event()  # Never set - rewarming is not cancellable
+    for entry in hot_audio[:SNAPSHOT_REWARM_AUDIO]:
+        wait_for_foreground_idle(idle)
+        try:
+            fetch_into_audio_cache(f"https://music.youtube.com/watch?v={entry['video_id']}", entry['quality'])
+        except Exception as e:
+            snapshot_log.warning(f"Rewarm of {entry['video_id']} failed: {e}")
+
+def restore_snapshot_in_background():
+    def restore():
+        REQUEST_ID.set('snapshot-restore')
+        try:
+            with open(SNAPSHOT_PATH, 'rb') as f:
+                hot_audio = import_snapshot(f.read())
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            snapshot_log.error(f"Restore failed: {e}")
+            return
+        if SNAPSHOT_REWARM_AUDIO > 0:
+            rewarm_audio(hot_audio)
+    
+    threading.Thread(target=restore, daemon=True).start()
+
+def schedule_snapshots():
+    def loop():
+        REQUEST_ID.set('snapshot')
+        while True:
+            time.sleep(SNAPSHOT_INTERVAL)
+            save_snapshot()
+    
+    if SNAPSHOT_INTERVAL > 0:
+        threading.Thread(target=loop, daemon=True).start()
+    if SNAPSHOT_ON_SHUTDOWN:
+        atexit.register(save_snapshot)
+
+@app.route('/api/admin/snapshot', methods=['GET'])
+def download_snapshot():
+    """Export the current caches as a snapshot file (e.g. to carry over to a new deploy)."""
+    denied = admin_only()
+    if denied:
+        return denied
+    response = Response(export_snapshot(), mimetype='application/octet-stream')
+    response.headers['Content-Disposition'] = 'attachment; filename="soundwave.swsnap"'
+    return response
+
+@app.route('/api/admin/snapshot', methods=['POST'])
+def upload_snapshot():
+    """Load a snapshot file sent as the request body."""
+    denied = admin_only()
+    if denied:
+        return denied
+    try:
+        hot_audio = import_snapshot(request.get_data())
+    except (ValueError, KeyError) as e:
+        return jsonify({'error': str(e)}), 400
+    if SNAPSHOT_REWARM_AUDIO > 0:
+        threading.Thread(target=rewarm_audio, args=(hot_audio,), daemon=True).start()
+    return jsonify({'success': True, 'hot_audio': len(hot_audio)})
+
+# Popularity tracking - a count-min sketch of requested (Spotify ID, quality) pairs whose
+# counts are halved every POPULARITY_DECAY_INTERVAL, plus a small table of the current
+# heavy hitters. During low-load hours the top tracks are pre-resolved and pre-transcoded
+# into the audio cache, so peak-hour requests for popular tracks are cache hits.
+POPULARITY_DECAY = float(os.environ.get('POPULARITY_DECAY', 0.5))
+POPULARITY_DECAY_INTERVAL = int(os.environ.get('POPULARITY_DECAY_INTERVAL', 3600))
+POPULARITY_TRACKED = int(os.environ.get('POPULARITY_TRACKED', 200))  # Heavy hitter candidates kept
+PREWARM_ENABLED = env_flag('PREWARM_ENABLED')
+PREWARM_TOP_N = int(os.environ.get('PREWARM_TOP_N', 20))
+PREWARM_HOURS = os.environ.get('PREWARM_HOURS', '2-6')  # Low-load window, server local time, "start-end"
+PREWARM_CPU_BUDGET = float(os.environ.get('PREWARM_CPU_BUDGET', 0.25))  # Max share of one core used by pre-warming
+PREWARM_CHECK_INTERVAL = int(os.environ.get('PREWARM_CHECK_INTERVAL', 300))
+popularity_log = get_logger('Popularity')
+
+class CountMinSketch:
+    """Approximate counters in fixed memory; estimates never undercount."""
+
+    def __init__(self, width=2048, depth=4):
+        self.width = width
+        self.depth = depth
+        self.rows = [[0.0] * width for _ in range(depth)]
+
+    def _columns(self, key):
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=4 * self.depth).digest()
+        return [int.from_bytes(digest[i * 4:i * 4 + 4], 'big') % self.width for i in range(self.depth)]
+
+    def add(self, key, count=1.0):
+        columns = self._columns(key)
+        for row, column in zip(self.rows, columns):
+            row[column] += count
+        return min(row[column] for row, column in zip(self.rows, columns))
+
+    def estimate(self, key):
+        return min(row[column] for row, column in zip(self.rows, self._columns(key)))
+
+    def decay(self, factor):
+        for row in self.rows:
+            for i, value in enumerate(row):
+                row[i] = value * factor
+
+POPULARITY = {'sketch': CountMinSketch(), 'tracks': {}, 'decayed_at': time.time()}
+POPULARITY_LOCK = threading.Lock()
+
+def record_popularity(url, quality, title=None, artist=None):
+    """Count a download request for a track/quality pair."""
+    spotify_id = extract_spotify_id(url, 'track')
+    if not spotify_id:
+        return
+    key = f"{spotify_id}:{quality}"
+    
+    with POPULARITY_LOCK:
+        if time.time() - POPULARITY['decayed_at'] >= POPULARITY_DECAY_INTERVAL:
+            POPULARITY['sketch'].decay(POPULARITY_DECAY)
+            POPULARITY['decayed_at'] = time.time()
+        
+        score = POPULARITY['sketch'].add(key)
+        tracks = POPULARITY['tracks']
+        tracks[key] = {'url': url, 'quality': str(quality), 'title': title, 'artist': artist}
+        if len(tracks) > POPULARITY_TRACKED:
+            # Drop the least popular candidate (never the one just counted)
+            coldest = min((k for k in tracks if k != key), key=POPULARITY['sketch'].estimate)
+            if POPULARITY['sketch'].estimate(coldest) <= score:
+                del tracks[coldest]
+
+def top_tracks(n):
+    with POPULARITY_LOCK:
+        sketch = POPULARITY['sketch']
+        ranked = sorted(
+            ({**track, 'key': key, 'score': sketch.estimate(key)} for key, track in POPULARITY['tracks'].items()),
+            key=lambda track: track['score'],
+            reverse=True
+        )
+    return ranked[:n]
+
+def export_popularity():
+    with POPULARITY_LOCK:
+        return {'rows': POPULARITY['sketch'].rows, 'tracks': dict(POPULARITY['tracks'])}
+
+def import_popularity(data):
+    """Add snapshot counts to the current ones (used when restoring a snapshot)."""
+    with POPULARITY_LOCK:
+        sketch = POPULARITY['sketch']
+        if len(data['rows']) != sketch.depth or len(data['rows'][0]) != sketch.width:
+            return
+        for row, saved in zip(sketch.rows, data['rows']):
+            for i, value in enumerate(saved):
+                row[i] += value
+        for key, track in data['tracks'].items():
+            POPULARITY['tracks'].setdefault(key, track)
+
+def in_prewarm_window(now=None):
+    """True if the current hour falls into PREWARM_HOURS (which may wrap past midnight)."""
+    try:
+        start, end = (int(hour) for hour in PREWARM_HOURS.split('-'))
+    except ValueError:
+        return False
+    hour = (now or datetime.now()).hour
+    if start <= end:
+        return start <= hour < end
+    return hour >= start or hour < end
+
+# Pre-warm downloads run in a worker process so their CPU time (including the FFmpeg
+# conversion) can be measured on their own - os.times() children counters are process-wide
+# and would also charge the budget for foreground downloads running at the same time
+PREWARM_WORKER = (
+    "import sys; sys.path.insert(0, sys.argv[1]); import server; "
+    "server.fetch_into_audio_cache(sys.argv[2], sys.argv[3])"
+)
+
+def fetch_in_worker(youtube_url, quality):
+    """fetch_into_audio_cache() in a child process; returns the CPU seconds it and its children used."""
+    worker = subprocess.Popen([
+        sys.executable, '-c', PREWARM_WORKER,
+        os.path.dirname(os.path.abspath(__file__)), youtube_url, str(quality)
+    ])
+    _, status, usage = os.wait4(worker.pid, 0)  # rusage covers the worker's reaped children too
+    worker.returncode = os.waitstatus_to_exitcode(status)
+    if worker.returncode != 0:
+        popularity_log.warning(f"Pre-warm worker for {youtube_url} exited with {worker.returncode}")
+    return usage.ru_utime + usage.ru_stime
+
+def prewarm_track(track):
+    """
+    Resolve the match for a popular track and transcode it into the audio cache.
+    Returns (warmed, CPU seconds used by the worker process).
+    """
+    metadata = research_spotify_metadata(track['url']) or {}
+    artist = metadata.get('artist') or track.get('artist')
+    title = metadata.get('title') or track.get('title')
+    duration = metadata.get('duration')
+    
+    recording_key, match = resolve_identity(
+        extract_spotify_id(track['url'], 'track'), metadata.get('isrc'), artist, title, duration
+    )
+    indexed = match is not None
+    if not match and artist and title:
+        match = find_youtube_match(artist, title, duration)
+    if not match:
+        return False, 0.0
+    
+    cache_path = audio_cache_path(match['webpage_url'], track['quality'])
+    if not cache_path or os.path.exists(cache_path):
+        return False, 0.0
+    
+    worker_cpu = fetch_in_worker(match['webpage_url'], track['quality'])
+    if not os.path.exists(cache_path):
+        return False, worker_cpu
+    probe = probe_mp3(cache_path)
+    if duration and probe and not is_duration_valid(float(duration), probe['duration_us'] / 1_000_000):
+        popularity_log.warning(f"Pre-warmed '{title}' has the wrong length, discarding")
+        os.remove(cache_path)
+        return False, worker_cpu
+    if recording_key and not indexed:
+        store_recording_match(recording_key, match)
+    return True, worker_cpu
+
+def run_prewarm():
+    """Warm the top tracks while the window lasts, keeping CPU use within PREWARM_CPU_BUDGET."""
+    warmed = 0
+    idle = threading.Event()  # Never set - pre-warming stops when the window closes instead
+    for track in top_tracks(PREWARM_TOP_N):
+        if not in_prewarm_window():
+            break
+        wait_for_foreground_idle(idle)
+        
+        # Only this thread and its worker process count - not concurrent foreground requests
+        wall_start, cpu_start = time.monotonic(), time.thread_time()
+        worker_cpu = 0.0
+        try:
+            ok, worker_cpu = prewarm_track(track)
+            if ok:
+                warmed += 1
+        except Exception as e:
+            popularity_log.warning(f"Pre-warm of {track['key']} failed: {e}")
+        
+        # Sleep long enough that CPU used / wall time stays under the budget
+        cpu_used = time.thread_time() - cpu_start + worker_cpu
+        wall_used = time.monotonic() - wall_start
+        if PREWARM_CPU_BUDGET > 0:
+            time.sleep(max(0.0, cpu_used / PREWARM_CPU_BUDGET - wall_used))
+    if warmed:
+        popularity_log.info(f"Pre-warmed {warmed} popular tracks into the audio cache")
+
+def schedule_prewarm():
+    def loop():
+        REQUEST_ID.set('prewarm')
+        while True:
+            time.sleep(PREWARM_CHECK_INTERVAL)
+            if in_prewarm_window():
+                run_prewarm()
+    
+    if PREWARM_ENABLED and AUDIO_CACHE_MAX_MB > 0:
+        threading.Thread(target=loop, daemon=True).start()
+
+def start_background_jobs():
+    """
+    Restore the last snapshot and start the snapshot and pre-warm schedulers.
+    Called by the server entry points (__main__ and gunicorn.conf.py), never on import,
+    so tests and tools can import this module without reading or writing the snapshot.
+    """
+    restore_snapshot_in_background()
+    schedule_snapshots()
+    schedule_prewarm()
+
+@app.route('/api/admin/popular', methods=['GET'])
+def popular_tracks():
+    """Current most requested tracks with their decayed request counts."""
+    denied = admin_only()
+    if denied:
+        return denied
+    try:
+        n = int(request.args.get('n', PREWARM_TOP_N))
+    except ValueError:
+        return jsonify({'error': 'n must be an integer'}), 400
+    return jsonify({'tracks': top_tracks(n)})
+
 def download_spotify(url, passed_title=None, passed_artist=None, passed_duration=None, passed_youtube_url=None, quality='320'):
     file_id = str(uuid.uuid4())[:8]
     current_download_dir = os.path.join(DOWNLOAD_DIR, file_id)
@@ -709,37 +2707,32 @@ def download_spotify(url, passed_title=None, passed_artist=None, passed_duration
     # --- RESEARCH PHASE ---
     # Always fetch fresh metadata from the track's own Spotify page
     # This ensures accuracy, especially for playlist tracks
-    print(f"[Research] Fetching fresh metadata for: {url}")
+    research_log.info(f"Fetching fresh metadata for: {url}")
     
     researched_title = passed_title
     researched_artist = passed_artist
     researched_duration = passed_duration
     
-    try:
-        oembed_url = f"https://open.spotify.com/oembed?url={url}"
-        oembed_resp = requests.get(oembed_url, timeout=5)
-        if oembed_resp.status_code == 200:
-            data = oembed_resp.json()
-            full_title = data.get('title', '')
-            author = data.get('author_name', '')
-            
-            if ' by ' in full_title:
-                parts = full_title.rsplit(' by ', 1)
-                researched_title = parts[0]
-                if author and author != 'Spotify':
-                    researched_artist = author
-                else:
-                    researched_artist = parts[1]
-            else:
-                researched_title = full_title
-                researched_artist = author if author and author != 'Spotify' else passed_artist
-            
-            # Fetch duration
-            researched_duration = scrape_spotify_duration(url) or passed_duration
-            
-            print(f"[Research] Confirmed: '{researched_artist} - {researched_title}' ({researched_duration}s)")
-    except Exception as e:
-        print(f"[Research] oEmbed failed: {e}, using passed metadata")
+    with trace_span('research'):
+        metadata = research_spotify_metadata(url)
+    if metadata:
+        researched_title = metadata['title']
+        researched_artist = metadata['artist'] or passed_artist
+        researched_duration = metadata['duration'] or passed_duration
+        research_log.info(f"Confirmed: '{researched_artist} - {researched_title}' ({researched_duration}s)")
+    
+    # Link this Spotify ID to its recording; reuse the match of any alias
+    recording_key, indexed_match = None, None
+    spotify_id = extract_spotify_id(url, 'track')
+    if spotify_id:
+        with trace_span('identity'):
+            recording_key, indexed_match = resolve_identity(
+                spotify_id,
+                (metadata or {}).get('isrc'),
+                researched_artist,
+                researched_title,
+                researched_duration
+            )
     
     fallback_title = researched_title or passed_title or "Spotify Track"
     
@@ -767,48 +2760,79 @@ def download_spotify(url, passed_title=None, passed_artist=None, passed_duration
     
     try:
         youtube_url_used = passed_youtube_url  # Use preview URL if provided
+        video = None
         
-        # If we have a YouTube URL from preview, use it directly!
         if youtube_url_used:
-            print(f"[Download] Using preview YouTube URL: {youtube_url_used}")
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                ydl.download([youtube_url_used])
-            print("Download from preview URL success!")
-            return process_and_send_spotify_file(current_download_dir, file_id, youtube_url_used)
-        
-        # Check if we have valid metadata
-        if not researched_title or not researched_artist or "Spotify" in researched_artist:
-            print(f"Download aborted: Bad metadata")
-            try:
-                shutil.rmtree(current_download_dir)
-            except:
-                pass
-            return jsonify({'error': 'Track not found (Spotify metadata could not be read)'}), 404
+            # If we have a YouTube URL from preview, use it directly!
+            download_log.info(f"Using preview YouTube URL: {youtube_url_used}")
+            # Index it only if it is our own match from /api/preview, not an arbitrary client URL
+            cached = cache_get(MATCH_CACHE, match_cache_key(passed_artist, passed_title))
+            if cached and cached.get('webpage_url') == youtube_url_used:
+                video = cached
+        elif indexed_match:
+            # Another alias of this recording was already resolved
+            video = indexed_match
+            youtube_url_used = video.get('webpage_url')
+            download_log.info(f"Identity index hit ({recording_key}): {youtube_url_used}")
+        else:
+            # Check if we have valid metadata
+            if not researched_title or not researched_artist or "Spotify" in researched_artist:
+                download_log.warning("Download aborted: Bad metadata")
+                try:
+                    shutil.rmtree(current_download_dir)
+                except:
+                    pass
+                return jsonify({'error': 'Track not found (Spotify metadata could not be read)'}), 404
+            
+            download_log.info(f"Searching YouTube Music: {researched_artist} - {researched_title}")
+            
+            # Search YouTube Music (official audio tracks only)
+            with trace_span('match'):
+                video = find_youtube_match(researched_artist, researched_title, researched_duration)
+            
+            if not video:
+                try:
+                    shutil.rmtree(current_download_dir)
+                except:
+                    pass
+                return jsonify({'error': 'No results found on YouTube Music'}), 404
+            
+            youtube_url_used = video.get('webpage_url')
+            download_log.info(f"Found: {video.get('title')}")
+            download_log.info(f"YouTube Music URL: {youtube_url_used}")
         
-        print(f"[Download] Searching YouTube Music: {researched_artist} - {researched_title}")
+        cache_path = audio_cache_path(youtube_url_used, quality)
+        if cache_path and os.path.exists(cache_path):
+            download_log.info(f"Audio cache hit: {os.path.basename(cache_path)}")
+            shutil.rmtree(current_download_dir, ignore_errors=True)
+            os.utime(cache_path)  # Mark as recently used
+            return send_audio_file(cache_path, fallback_title, youtube_url_used, delete_after=False)
         
-        # Search YouTube Music (official audio tracks only)
-        video = youtube_music_search(researched_artist, researched_title)
+        download_audio(youtube_url_used, ydl_opts, current_download_dir, fallback_title, quality)
         
-        if not video:
-            try:
-                shutil.rmtree(current_download_dir)
-            except:
-                pass
-            return jsonify({'error': 'No results found on YouTube Music'}), 404
+        download_log.info("Download success!")
         
-        youtube_url_used = video.get('webpage_url')
-        print(f"[Download] Found: {video.get('title')}")
-        print(f"YouTube Music URL: {youtube_url_used}")
+        with trace_span('duration_check'):
+            duration_error = check_download_duration(current_download_dir, researched_duration)
+        if duration_error:
+            # Wrong recording - forget the match so the next attempt searches again
+            if passed_youtube_url:
+                # /api/preview cached it under the client's artist/title
+                cache_evict(MATCH_CACHE, match_cache_key(passed_artist, passed_title))
+            if indexed_match and youtube_url_used == indexed_match.get('webpage_url'):
+                forget_recording_match(recording_key)
+            elif video:
+                cache_evict(MATCH_CACHE, match_cache_key(researched_artist, researched_title))
+            shutil.rmtree(current_download_dir, ignore_errors=True)
+            return jsonify({'error': duration_error}), 404
         
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            ydl.download([youtube_url_used])
-                
-        print("Download success!")
-        return process_and_send_spotify_file(current_download_dir, file_id, youtube_url_used)
+        # Only our own search results are indexed - a client-supplied URL is never shared
+        if recording_key and video and video is not indexed_match:
+            store_recording_match(recording_key, video)
+        return process_and_send_spotify_file(current_download_dir, file_id, youtube_url_used, cache_path)
         
     except Exception as e:
-        print(f"Fallback failed: {e}")
+        download_log.error(f"Fallback failed: {e}")
         try:
             shutil.rmtree(current_download_dir)
         except:
@@ -816,7 +2840,30 @@ def download_spotify(url, passed_title=None, passed_artist=None, passed_duration
         return jsonify({'error': f'Download error: {str(e)}'}), 404
 
 
-def process_and_send_spotify_file(download_dir, file_id, youtube_url=None):
+def check_download_duration(download_dir, expected_duration):
+    """
+    Compare the downloaded MP3's length (header probe) with the Spotify duration.
+    Returns an error message for a wrong-length match, None if it looks right.
+    """
+    try:
+        files = [f for f in os.listdir(download_dir) if f.endswith('.mp3')]
+    except OSError:
+        return None
+    if not files or not expected_duration:
+        return None
+    
+    probe = probe_mp3(os.path.join(download_dir, files[0]))
+    if not probe:
+        return None
+    
+    actual = probe['duration_us'] / 1_000_000
+    if is_duration_valid(float(expected_duration), actual):
+        return None
+    
+    download_log.warning(f"REJECT (duration mismatch): got {actual:.1f}s, Spotify says {expected_duration}s")
+    return f'Downloaded track length does not match Spotify ({actual:.0f}s vs {expected_duration}s)'
+
+def process_and_send_spotify_file(download_dir, file_id, youtube_url=None, cache_path=None):
     filepath = None
     title = 'Spotify Track'
     
@@ -833,6 +2880,14 @@ def process_and_send_spotify_file(download_dir, file_id, youtube_url=None):
     if not filepath:
         return jsonify({'error': 'Fayl tapılmadı'}), 404
         
+    if cache_path:
+        try:
+            store_in_audio_cache(filepath, cache_path)
+            shutil.rmtree(download_dir, ignore_errors=True)
+            return send_audio_file(cache_path, title, youtube_url, delete_after=False)
+        except OSError as e:
+            download_log.warning(f"Audio cache store failed: {e}")
+    
     new_filepath = os.path.join(DOWNLOAD_DIR, f"{file_id}_{title}.mp3")
     shutil.move(filepath, new_filepath)
     try:
@@ -842,7 +2897,7 @@ def process_and_send_spotify_file(download_dir, file_id, youtube_url=None):
         
     return send_audio_file(new_filepath, title, youtube_url)
 
-def send_audio_file(filepath, title, youtube_url=None):
+def send_audio_file(filepath, title, youtube_url=None, delete_after=True):
     # Increment download counter for social proof
     today = date.today().isoformat()
     if STATS['last_reset'] != today:
@@ -862,18 +2917,21 @@ def send_audio_file(filepath, title, youtube_url=None):
         filename = f"{filename}{ext}"
     
     try:
-        file_size = os.path.getsize(filepath)
+        # Open now so a cached file evicted mid-request can still be streamed
+        audio_file = open(filepath, 'rb')
+        file_size = os.fstat(audio_file.fileno()).st_size
     except:
         return jsonify({'error': 'Fayl oxuna bilmədi'}), 500
     
     def generate():
-        with open(filepath, 'rb') as f:
+        with audio_file as f:
             while chunk := f.read(8192):
                 yield chunk
-        try:
-            os.remove(filepath)
-        except:
-            pass
+        if delete_after:
+            try:
+                os.remove(filepath)
+            except:
+                pass
     
     response = Response(generate(), mimetype=content_type)
     response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
@@ -905,4 +2963,7 @@ if __name__ == '__main__':
     print(f"🎬 FFmpeg: {FFMPEG_PATH}")
     print(f"🌐 Server running on 0.0.0.0:{port}")
     print("=" * 50)
+    # Exit cleanly on SIGTERM (Railway redeploys) so the shutdown snapshot is written
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    start_background_jobs()
     app.run(host='0.0.0.0', port=port, debug=False)
@@ -0,0 +1,126 @@
+"""
+Local multi-process harness for cluster mode.
+
+Starts N real server.py nodes (YouTube search stubbed with a fixed latency, every other
+code path real) and replays a skewed stream of Spotify track previews against random
+nodes twice: once with cluster mode off, and once with CLUSTER_SELF/CLUSTER_PEERS set
+so non-owners forward to the owner. Match cache hits are read from each node's
+/api/cluster.
+
+    python tests/cluster_harness.py [nodes] [requests]
+"""
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+CATALOG_SIZE = 1000  # Distinct tracks
+ZIPF_S = 1.1  # Popularity skew
+SEARCH_LATENCY = 0.05  # Seconds per stubbed YouTube search
+CLIENTS = 16  # Concurrent requests
+
+NODE_BOOT = """
+import sys
+import time
+import server
+
+def youtube_music_search(artist, title, duration=None):
+    time.sleep(float(sys.argv[2]))
+    return {'webpage_url': 'https://music.youtube.com/watch?v=' + title[-11:], 'title': title, 'duration': duration}
+
+server.youtube_music_search = youtube_music_search
+server.store_recording_match = lambda recording_key, match: None  # Measure the match cache alone
+server.app.run(host='127.0.0.1', port=int(sys.argv[1]), threaded=True)
+"""
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_nodes(node_count, clustered, data_root):
+    urls = [f'http://127.0.0.1:{free_port()}' for _ in range(node_count)]
+    processes = []
+    for i, url in enumerate(urls):
+        env = dict(os.environ, SOUNDWAVE_DATA_DIR=os.path.join(data_root, f'node{i}'))
+        env.pop('CLUSTER_PEERS_FILE', None)
+        if clustered:
+            env.update(CLUSTER_SELF=url, CLUSTER_PEERS=','.join(urls), CLUSTER_MODE='forward')
+        else:
+            env.pop('CLUSTER_SELF', None)
+        processes.append(subprocess.Popen(
+            [sys.executable, '-c', NODE_BOOT, url.rsplit(':', 1)[1], str(SEARCH_LATENCY)],
+            cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        ))
+
+    for url in urls:
+        for _ in range(200):
+            try:
+                requests.get(url, timeout=1)
+                break
+            except requests.ConnectionError:
+                time.sleep(0.1)
+        else:
+            raise RuntimeError(f'{url} did not start')
+    return urls, processes
+
+
+def run(node_count, stream, clustered):
+    with tempfile.TemporaryDirectory() as data_root:
+        urls, processes = start_nodes(node_count, clustered, data_root)
+        try:
+            session = requests.Session()
+            session.mount('http://', requests.adapters.HTTPAdapter(pool_maxsize=CLIENTS))
+            rng = random.Random(7)
+            targets = [rng.choice(urls) for _ in stream]
+
+            def preview(args):
+                node, track_id = args
+                response = session.post(f'{node}/api/preview', json={
+                    'url': f'https://open.spotify.com/track/{track_id}',
+                    'artist': 'Artist',
+                    'title': f'Track {track_id}',
+                    'duration': 200
+                }, timeout=30)
+                response.raise_for_status()
+
+            started = time.monotonic()
+            with ThreadPoolExecutor(CLIENTS) as pool:
+                list(pool.map(preview, zip(targets, stream)))
+            elapsed = time.monotonic() - started
+
+            stats = [session.get(f'{url}/api/cluster', timeout=5).json() for url in urls]
+        finally:
+            for process in processes:
+                process.terminate()
+            for process in processes:
+                process.wait(10)
+
+    hits = sum(s['match_cache']['hits'] for s in stats)
+    misses = sum(s['match_cache']['misses'] for s in stats)
+    forwarded = sum(s['forwarded'] for s in stats)
+    return hits / (hits + misses), misses, forwarded, elapsed
+
+
+if __name__ == '__main__':
+    node_count = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    request_count = int(sys.argv[2]) if len(sys.argv) > 2 else 3000
+
+    random.seed(42)
+    catalog = [f"{i:022d}" for i in range(CATALOG_SIZE)]
+    weights = [1 / (rank + 1) ** ZIPF_S for rank in range(CATALOG_SIZE)]
+    stream = random.choices(catalog, weights=weights, k=request_count)
+
+    print(f"Nodes: {node_count}, requests: {request_count}, distinct tracks: {len(set(stream))}")
+    for label, clustered in (('Random routing', False), ('Hash ring', True)):
+        rate, searches, forwarded, elapsed = run(node_count, stream, clustered)
+        print(f"{label + ':':16} hit rate {rate:.1%}, {searches} searches, {forwarded} forwarded, {elapsed:.1f}s")
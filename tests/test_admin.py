@@ -0,0 +1,39 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import server
+
+TOKEN = 'secret'
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(server, 'ADMIN_TOKEN', TOKEN)
+    return server.app.test_client()
+
+
+def sample(client, token=TOKEN, **args):
+    return client.get('/api/admin/sample', query_string=args, headers={'X-Admin-Token': token})
+
+
+def test_wrong_or_non_ascii_token_is_forbidden(client):
+    assert sample(client, token='wrong', seconds='0.05').status_code == 403
+    assert sample(client, token='sécret', seconds='0.05').status_code == 403
+
+
+def test_sample_returns_folded_stacks(client):
+    response = sample(client, seconds='0.05', interval_ms='5')
+    assert response.status_code == 200
+
+
+@pytest.mark.parametrize('args', [
+    {'seconds': 'abc'},
+    {'interval_ms': 'fast'},
+    {'seconds': 'nan'},
+    {'seconds': '-1'},
+])
+def test_bad_sample_arguments_are_rejected(client, args):
+    assert sample(client, **args).status_code == 400
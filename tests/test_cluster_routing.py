@@ -0,0 +1,139 @@
+"""
+Routing between two nodes: this process is the non-owner (Flask test client) and the
+owner is a real server.py instance in a subprocess. Both stub out the YouTube search.
+"""
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+import requests
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+import server
+from server import HashRing
+
+OWNER_BOOT = """
+import sys
+import server
+
+def find_youtube_match(artist, title, duration=None):
+    return {'webpage_url': 'https://music.youtube.com/watch?v=owner0000001',
+            'title': 'owner:' + server.REQUEST_ID.get(), 'duration': duration}
+
+server.find_youtube_match = find_youtube_match
+server.store_recording_match = lambda recording_key, match: None  # Answer from the stub every time
+server.app.run(host='127.0.0.1', port=int(sys.argv[1]))
+"""
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture(scope='module')
+def owner(tmp_path_factory):
+    port = free_port()
+    url = f'http://127.0.0.1:{port}'
+    env = dict(os.environ, CLUSTER_SELF=url, SOUNDWAVE_DATA_DIR=str(tmp_path_factory.mktemp('owner')))
+    process = subprocess.Popen(
+        [sys.executable, '-c', OWNER_BOOT, str(port)], cwd=ROOT, env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        for _ in range(100):
+            try:
+                requests.get(url, timeout=1)
+                break
+            except requests.ConnectionError:
+                time.sleep(0.1)
+        else:
+            pytest.fail('owner node did not start')
+        yield url
+    finally:
+        process.terminate()
+        process.wait(10)
+
+
+@pytest.fixture
+def node(monkeypatch, owner, tmp_path):
+    """Configure this process as the second node of a two-node ring."""
+    self_url = f'http://127.0.0.1:{free_port()}'  # Never contacted
+    ring = HashRing([self_url, owner])
+    monkeypatch.setattr(server, 'CLUSTER_SELF', self_url)
+    monkeypatch.setattr(server, 'CLUSTER_PEERS_FILE', None)
+    monkeypatch.setattr(server, 'CLUSTER', {
+        'ring': ring, 'peers_mtime': None, 'local': 0, 'forwarded': 0, 'forward_errors': 0
+    })
+    monkeypatch.setattr(server, 'IDENTITY_DB_PATH', str(tmp_path / 'identity.sqlite3'))
+    monkeypatch.setattr(server, 'IDENTITY_LOCAL', threading.local())
+    server.init_identity_db()
+    monkeypatch.setattr(server, 'find_youtube_match', lambda artist, title, duration=None: {
+        'webpage_url': 'https://music.youtube.com/watch?v=local0000001', 'title': 'local', 'duration': duration
+    })
+    return ring, self_url
+
+
+def track_owned_by(ring, node_url):
+    for i in range(1000):
+        track_id = f'{i:022d}'
+        if ring.get(track_id) == node_url:
+            return {'url': f'https://open.spotify.com/track/{track_id}', 'artist': 'Band', 'title': 'Song', 'duration': 200}
+    raise AssertionError('no key for node')
+
+
+def test_non_owner_forwards_to_owner(node, owner):
+    ring, _ = node
+    response = server.app.test_client().post('/api/preview', json=track_owned_by(ring, owner))
+
+    assert response.status_code == 200
+    # Served by the owner, under the request ID this node assigned
+    assert response.json['youtube_title'] == f"owner:{response.headers['X-Request-ID']}"
+    assert response.json['youtube_duration'] == 200
+    assert server.CLUSTER['forwarded'] == 1
+
+
+def test_owned_track_is_served_locally(node):
+    ring, self_url = node
+    response = server.app.test_client().post('/api/preview', json=track_owned_by(ring, self_url))
+
+    assert response.json['youtube_title'] == 'local'
+    assert server.CLUSTER['local'] == 1
+    assert server.CLUSTER['forwarded'] == 0
+
+
+def test_redirect_mode(node, owner, monkeypatch):
+    ring, _ = node
+    monkeypatch.setattr(server, 'CLUSTER_MODE', 'redirect')
+    response = server.app.test_client().post('/api/preview', json=track_owned_by(ring, owner))
+
+    assert response.status_code == 307
+    assert response.headers['Location'] == f'{owner}/api/preview'
+
+
+def test_serves_locally_when_owner_is_down(node):
+    _, self_url = node
+    down = f'http://127.0.0.1:{free_port()}'  # Nothing listening
+    ring = HashRing([self_url, down])
+    server.CLUSTER['ring'] = ring
+    response = server.app.test_client().post('/api/preview', json=track_owned_by(ring, down))
+
+    assert response.status_code == 200
+    assert response.json['youtube_title'] == 'local'
+    assert server.CLUSTER['forward_errors'] == 1
+
+
+def test_forwarded_requests_are_never_forwarded_again(node, owner):
+    ring, _ = node
+    response = server.app.test_client().post(
+        '/api/preview', json=track_owned_by(ring, owner), headers={server.CLUSTER_FORWARDED_HEADER: owner}
+    )
+
+    assert response.json['youtube_title'] == 'local'
+    assert server.CLUSTER['forwarded'] == 0
@@ -0,0 +1,87 @@
+import os
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import server
+from server import match_cache_key
+
+ISRC = 'USRC17607839'
+ALIASES = ['https://open.spotify.com/track/' + c * 22 for c in 'ab']  # Single and album release
+TRACK = {'artist': 'Band', 'title': 'Song', 'duration': 200}
+
+
+@pytest.fixture
+def app(monkeypatch, tmp_path):
+    """Stub search, metadata and download; fresh caches and identity index."""
+    calls = {'searches': [], 'downloads': []}
+    state = {'duration_error': None}
+
+    def youtube_music_search(artist, title, duration=None):
+        calls['searches'].append((artist, title))
+        return {'webpage_url': f"https://music.youtube.com/watch?v={len(calls['searches']):011d}",
+                'title': title, 'duration': duration}
+
+    def download_audio(youtube_url, ydl_opts, download_dir, title, quality):
+        calls['downloads'].append(youtube_url)
+        with open(os.path.join(download_dir, f'{title}.mp3'), 'wb') as f:
+            f.write(b'mp3')
+
+    monkeypatch.setattr(server, 'MATCH_CACHE', {})
+    monkeypatch.setattr(server, 'IDENTITY_DB_PATH', str(tmp_path / 'identity.sqlite3'))
+    monkeypatch.setattr(server, 'IDENTITY_LOCAL', threading.local())
+    monkeypatch.setattr(server, 'AUDIO_CACHE_MAX_MB', 0)
+    monkeypatch.setattr(server, 'DOWNLOAD_DIR', str(tmp_path))
+    monkeypatch.setattr(server, 'record_popularity', lambda *args: None)
+    monkeypatch.setattr(server, 'research_spotify_metadata', lambda url: dict(TRACK, isrc=ISRC))
+    monkeypatch.setattr(server, 'youtube_music_search', youtube_music_search)
+    monkeypatch.setattr(server, 'download_audio', download_audio)
+    monkeypatch.setattr(server, 'check_download_duration', lambda download_dir, duration: state['duration_error'])
+    server.init_identity_db()
+
+    client = server.app.test_client()
+    client.calls = calls
+    client.state = state
+    return client
+
+
+def preview_then_download(client, url):
+    preview = client.post('/api/preview', json=dict(TRACK, url=url)).json
+    return client.post('/api/download', json=dict(TRACK, url=url, youtube_url=preview['youtube_url']))
+
+
+def test_rejected_preview_match_is_evicted(app):
+    app.state['duration_error'] = 'Downloaded track length does not match Spotify'
+    assert preview_then_download(app, ALIASES[0]).status_code == 404
+    assert match_cache_key(TRACK['artist'], TRACK['title']) not in server.MATCH_CACHE
+
+    app.state['duration_error'] = None
+    assert preview_then_download(app, ALIASES[0]).status_code == 200
+    assert len(app.calls['searches']) == 2  # Searched again instead of reusing the bad match
+
+    server.MATCH_CACHE.clear()
+    assert preview_then_download(app, ALIASES[1]).status_code == 200
+    assert app.calls['downloads'][-1] != app.calls['downloads'][0]  # Not the rejected match
+
+
+def test_second_alias_reuses_the_indexed_match(app):
+    assert preview_then_download(app, ALIASES[0]).status_code == 200
+    assert len(app.calls['searches']) == 1
+
+    server.MATCH_CACHE.clear()  # Another worker, or after a restart - only the index is shared
+    assert preview_then_download(app, ALIASES[1]).status_code == 200
+    assert len(app.calls['searches']) == 1
+    assert app.calls['downloads'][0] == app.calls['downloads'][1]
+
+
+def test_client_supplied_url_is_not_indexed(app):
+    url = 'https://music.youtube.com/watch?v=elsewhere00'
+    response = app.post('/api/download', json=dict(TRACK, url=ALIASES[0], youtube_url=url))
+    assert response.status_code == 200
+
+    server.MATCH_CACHE.clear()
+    preview = app.post('/api/preview', json=dict(TRACK, url=ALIASES[1])).json
+    assert preview['youtube_url'] != url
+    assert len(app.calls['searches']) == 1
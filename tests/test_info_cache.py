@@ -0,0 +1,100 @@
+import gzip
+import json
+import os
+import sys
+from collections import OrderedDict
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import server
+
+PLAYLIST = 'https://open.spotify.com/playlist/37i9dQZF1DXcBWIGoYBM5M'
+TRACKS = [
+    {'title': f'Song {i}', 'artist': ['Ayaz', 'Sami Yusuf'][i % 2], 'duration': 200 + i,
+     'url': f'https://open.spotify.com/track/{i:022d}'}
+    for i in range(50)
+]
+
+
+class OEmbed:
+    status_code = 200
+
+    def json(self):
+        return {'title': 'Mix'}
+
+
+@pytest.fixture
+def client(monkeypatch):
+    calls = {'scrapes': 0, 'prefetches': []}
+
+    def get_playlist_tracks(playlist_id, url_type='playlist'):
+        calls['scrapes'] += 1
+        return [dict(track) for track in TRACKS]
+
+    monkeypatch.setattr(server, 'INFO_CACHE', OrderedDict())
+    monkeypatch.setattr(server, 'get_playlist_tracks', get_playlist_tracks)
+    monkeypatch.setattr(server, 'start_prefetch', lambda collection_id, tracks: calls['prefetches'].append(collection_id))
+    monkeypatch.setattr(server.requests, 'get', lambda *args, **kwargs: OEmbed())
+    return server.app.test_client(), calls
+
+
+def test_repeat_view_is_served_from_cache_and_restarts_prefetch(client):
+    test_client, calls = client
+    first = test_client.get('/api/info', query_string={'url': PLAYLIST})
+    second = test_client.get('/api/info', query_string={'url': PLAYLIST})
+
+    assert first.data == second.data
+    assert calls['scrapes'] == 1
+    assert calls['prefetches'] == ['37i9dQZF1DXcBWIGoYBM5M'] * 2
+
+
+def test_gzip_and_conditional_get(client):
+    test_client, _ = client
+    response = test_client.get('/api/info', query_string={'url': PLAYLIST}, headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert response.headers['ETag'].endswith('-gzip"')
+    assert json.loads(gzip.decompress(response.data))['tracks'] == TRACKS
+
+    revalidated = test_client.get(
+        '/api/info', query_string={'url': PLAYLIST},
+        headers={'Accept-Encoding': 'gzip', 'If-None-Match': response.headers['ETag']}
+    )
+    assert revalidated.status_code == 304
+    assert revalidated.data == b''
+
+    # The gzip ETag doesn't match the identity representation
+    identity = test_client.get(
+        '/api/info', query_string={'url': PLAYLIST}, headers={'If-None-Match': response.headers['ETag']}
+    )
+    assert identity.status_code == 200
+    assert 'Content-Encoding' not in identity.headers
+
+
+def test_columnar_format(client):
+    test_client, _ = client
+    tracks = test_client.get('/api/info', query_string={'url': PLAYLIST, 'format': 'columnar'}).json['tracks']
+
+    assert tracks['artists'] == ['Ayaz', 'Sami Yusuf']
+    decoded = [
+        {'title': title, 'artist': tracks['artists'][artist], 'duration': duration, 'url': tracks['url_prefix'] + track_id}
+        for title, artist, duration, track_id in zip(tracks['title'], tracks['artist'], tracks['duration'], tracks['id'])
+    ]
+    assert decoded == TRACKS
+
+
+def test_unresolved_track_is_not_cached(client, monkeypatch):
+    test_client, _ = client
+    track = 'https://open.spotify.com/track/' + 'a' * 22
+    monkeypatch.setattr(server, 'resolve_spotify_metadata', lambda url: {})
+    placeholder = test_client.get('/api/info', query_string={'url': track})
+
+    assert placeholder.json['title'] == 'Spotify Track'
+    assert placeholder.headers['Cache-Control'] == 'no-store'
+    assert 'ETag' not in placeholder.headers
+
+    monkeypatch.setattr(server, 'resolve_spotify_metadata', lambda url: {'title': 'Song', 'artist': 'Band', 'duration': 200})
+    resolved = test_client.get('/api/info', query_string={'url': track})
+    assert resolved.json['title'] == 'Song'
+    assert resolved.headers['Cache-Control'].startswith('public')
+    assert 'ETag' in resolved.headers
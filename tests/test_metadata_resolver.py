@@ -0,0 +1,165 @@
+import os
+import sys
+import threading
+import time
+
+import pytest
+import requests
+import yt_dlp
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import server
+from server import CircuitBreaker, is_source_outage, resolve_spotify_metadata
+
+
+def source(name, fields, result=None, delay=0, sleep=0, error=None):
+    def fetch(url):
+        time.sleep(sleep)
+        if error:
+            raise error
+        return result or {}
+    return {'name': name, 'delay': delay, 'fields': fields, 'fetch': fetch}
+
+
+@pytest.fixture
+def sources(monkeypatch):
+    """Install stub metadata sources with fresh breakers (threshold 1, no cooldown)."""
+    def install(*stubs, threshold=1, cooldown=0):
+        breakers = {s['name']: CircuitBreaker(s['name'], threshold, cooldown) for s in stubs}
+        monkeypatch.setattr(server, 'METADATA_SOURCES', list(stubs))
+        monkeypatch.setattr(server, 'METADATA_BREAKERS', breakers)
+        monkeypatch.setattr(server, 'METADATA_HEDGE_DELAY', 0.1)
+        return breakers
+    return install
+
+
+def wait_until(predicate, timeout=2):
+    end = time.monotonic() + timeout
+    while time.monotonic() < end:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def test_breaker_opens_after_threshold_and_lets_one_trial_through():
+    breaker = CircuitBreaker('test', threshold=2, cooldown=0.05)
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert not breaker.allow()
+
+    time.sleep(0.06)
+    assert breaker.allow()
+    assert not breaker.allow()  # Only one trial while half-open
+
+    breaker.record_success()
+    assert breaker.allow()
+    assert breaker.failures == 0
+
+
+def test_failed_trial_reopens_breaker():
+    breaker = CircuitBreaker('test', threshold=1, cooldown=0.05)
+    breaker.record_failure()
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.record_failure()
+    assert not breaker.allow()
+
+
+def test_fields_merge_by_source_priority(sources):
+    sources(
+        source('first', ('title', 'artist'), {'title': 'Song', 'artist': None}),
+        source('second', ('artist', 'duration'), {'artist': 'Band', 'duration': 200}),
+        source('third', ('title', 'artist', 'duration'), {'title': 'Other', 'artist': 'X', 'duration': 1}, delay=5),
+    )
+    assert resolve_spotify_metadata('url', deadline=2) == {'title': 'Song', 'artist': 'Band', 'duration': 200}
+
+
+def test_unlaunched_half_open_source_keeps_its_trial(sources):
+    breakers = sources(
+        source('fast', ('title', 'artist', 'duration'), {'title': 'Song', 'artist': 'Band', 'duration': 200}),
+        source('fallback', ('title', 'artist', 'duration'), {'title': 'Song'}, delay=5),
+    )
+    breakers['fallback'].record_failure()  # Open, cooldown 0 -> half-open
+
+    resolve_spotify_metadata('url', deadline=2)
+    assert breakers['fallback'].allow()
+
+
+def test_abandoned_source_outcome_is_recorded(sources):
+    breakers = sources(
+        source('fast', ('title', 'artist', 'duration'), {'title': 'Song', 'artist': 'Band', 'duration': 200}, sleep=0.05),
+        source('slow', ('title', 'artist', 'duration'), sleep=0.2, error=requests.ConnectionError('down')),
+    )
+    assert resolve_spotify_metadata('url', deadline=2)['title'] == 'Song'
+    assert wait_until(lambda: breakers['slow'].failures == 1)
+    assert breakers['fast'].failures == 0
+
+
+def test_source_hanging_past_deadline_is_tripped(sources):
+    release = threading.Event()
+
+    def hang(url):
+        release.wait(2)
+        return {'title': 'Late'}
+
+    breakers = sources(
+        {'name': 'hang', 'delay': 0, 'fields': ('title',), 'fetch': hang},
+        source('ok', ('artist', 'duration'), {'artist': 'Band', 'duration': 200}),
+        cooldown=60,
+    )
+    metadata = resolve_spotify_metadata('url', deadline=0.2)
+    assert metadata == {'artist': 'Band', 'duration': 200}
+    assert not breakers['hang'].allow()
+
+    release.set()  # The late success doesn't undo the timeout
+    time.sleep(0.05)
+    assert not breakers['hang'].allow()
+
+
+def http_error(status):
+    response = requests.Response()
+    response.status_code = status
+    return requests.HTTPError(f'{status} error', response=response)
+
+
+def test_only_outages_count_as_failures():
+    assert is_source_outage(requests.ConnectTimeout())
+    assert is_source_outage(requests.ConnectionError())
+    assert is_source_outage(http_error(503))
+    assert not is_source_outage(http_error(404))
+    assert not is_source_outage(ValueError('unexpected page'))
+
+    # yt-dlp wraps network errors in DownloadError(ExtractorError(cause=...))
+    transport = yt_dlp.networking.exceptions.TransportError('dns failure')
+    extractor = yt_dlp.utils.ExtractorError('Unable to download', cause=transport)
+    assert is_source_outage(yt_dlp.utils.DownloadError('ERROR', exc_info=(type(extractor), extractor, None)))
+    not_found = yt_dlp.utils.ExtractorError('not found', expected=True)
+    assert not is_source_outage(yt_dlp.utils.DownloadError('ERROR', exc_info=(type(not_found), not_found, None)))
+
+
+def test_unknown_track_ids_do_not_open_breakers(sources):
+    known = {'valid': {'title': 'Song', 'artist': 'Band', 'duration': 200}}
+
+    def fetch(url):
+        if url not in known:
+            raise http_error(404)
+        return known[url]
+
+    breakers = sources(
+        {'name': 'oembed', 'delay': 0, 'fields': ('title', 'artist', 'duration'), 'fetch': fetch},
+        {'name': 'page', 'delay': 0, 'fields': ('artist', 'duration'), 'fetch': fetch},
+        cooldown=60,
+    )
+    for bad in ('bad1', 'bad2', 'bad3'):
+        assert resolve_spotify_metadata(bad, deadline=2) == {}
+
+    assert resolve_spotify_metadata('valid', deadline=2) == known['valid']
+    assert all(breaker.opened_at is None for breaker in breakers.values())
+
+
+def test_server_errors_open_breakers(sources):
+    breakers = sources(source('oembed', ('title',), error=http_error(502)), cooldown=60)
+    resolve_spotify_metadata('url', deadline=2)
+    assert wait_until(lambda: breakers['oembed'].opened_at is not None)
@@ -0,0 +1,55 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from server import probe_mp3, is_duration_valid
+
+# MPEG-1 Layer III, 128 kbps, 44.1 kHz, stereo, no padding -> 417-byte frames
+FRAME_HEADER = b'\xff\xfb\x90\x00'
+FRAME_LENGTH = 417
+
+
+def frame(payload=b''):
+    body = payload + b'\x00' * (FRAME_LENGTH - 4 - len(payload))
+    return FRAME_HEADER + body
+
+
+def write(tmp_path, data):
+    path = tmp_path / 'track.mp3'
+    path.write_bytes(data)
+    return str(path)
+
+
+def test_scans_frames_without_tag(tmp_path):
+    probe = probe_mp3(write(tmp_path, frame() * 100))
+    assert probe['source'] == 'scan'
+    assert probe['frames'] == 100
+    assert probe['sample_rate'] == 44100
+    assert probe['duration_us'] == 100 * 1152 * 1_000_000 // 44100
+    assert abs(probe['bitrate'] - 128000) < 1000
+
+
+def test_reads_xing_frame_count(tmp_path):
+    xing = b'\x00' * 32 + b'Xing' + (1).to_bytes(4, 'big') + (5000).to_bytes(4, 'big')
+    probe = probe_mp3(write(tmp_path, frame(xing) + frame() * 10))
+    assert probe['source'] == 'xing'
+    assert probe['frames'] == 5000
+    assert probe['duration_us'] == 5000 * 1152 * 1_000_000 // 44100
+
+
+def test_skips_id3v2_tag(tmp_path):
+    id3 = b'ID3\x04\x00\x00' + bytes([0, 0, 1, 0]) + b'\xff' * 128  # 128-byte tag full of fake sync bytes
+    probe = probe_mp3(write(tmp_path, id3 + frame() * 50))
+    assert probe['frames'] == 50
+
+
+def test_rejects_non_mp3(tmp_path):
+    assert probe_mp3(write(tmp_path, b'not an mp3 file' * 100)) is None
+    assert probe_mp3(write(tmp_path, b'')) is None
+    assert probe_mp3(str(tmp_path / 'missing.mp3')) is None
+
+
+def test_duration_threshold():
+    assert is_duration_valid(200, 210)
+    assert not is_duration_valid(200, 230)
+    assert is_duration_valid(None, 230)
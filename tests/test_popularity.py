@@ -0,0 +1,88 @@
+import os
+import sys
+import threading
+from datetime import datetime
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import server
+from server import CountMinSketch, in_prewarm_window, record_popularity, top_tracks
+
+
+def track_url(i):
+    return f'https://open.spotify.com/track/{i:022d}'
+
+
+@pytest.fixture
+def popularity(monkeypatch):
+    monkeypatch.setattr(server, 'POPULARITY', {'sketch': CountMinSketch(), 'tracks': {}, 'decayed_at': server.time.time()})
+    monkeypatch.setattr(server, 'POPULARITY_DECAY_INTERVAL', 3600)
+    return server.POPULARITY
+
+
+def test_sketch_never_undercounts():
+    sketch = CountMinSketch(width=16, depth=3)  # Narrow, so keys collide
+    counts = {f'key{i}': i % 7 + 1 for i in range(100)}
+    for key, count in counts.items():
+        for _ in range(count):
+            sketch.add(key)
+    assert all(sketch.estimate(key) >= count for key, count in counts.items())
+    assert CountMinSketch().estimate('unseen') == 0
+
+
+def test_decay_scales_counts(popularity, monkeypatch):
+    for _ in range(8):
+        record_popularity(track_url(1), '320')
+    assert top_tracks(1)[0]['score'] == 8
+
+    popularity['decayed_at'] -= 3600  # Interval elapsed - the next request decays first
+    record_popularity(track_url(1), '320')
+    assert top_tracks(1)[0]['score'] == 8 * 0.5 + 1
+
+
+def test_top_tracks_ranks_by_count(popularity):
+    for i, count in enumerate([1, 5, 3]):
+        for _ in range(count):
+            record_popularity(track_url(i), '320')
+    assert [track['url'] for track in top_tracks(2)] == [track_url(1), track_url(2)]
+
+
+def test_download_rejects_unknown_quality(popularity):
+    response = server.app.test_client().post('/api/download', json={'url': track_url(1), 'quality': '9999'})
+    assert response.status_code == 400
+    assert popularity['tracks'] == {}
+
+
+@pytest.mark.parametrize('hours, hour, expected', [
+    ('2-6', 2, True),
+    ('2-6', 5, True),
+    ('2-6', 6, False),
+    ('2-6', 1, False),
+    ('22-4', 23, True),
+    ('22-4', 3, True),
+    ('22-4', 12, False),
+    ('bad', 3, False),
+])
+def test_prewarm_window(monkeypatch, hours, hour, expected):
+    monkeypatch.setattr(server, 'PREWARM_HOURS', hours)
+    assert in_prewarm_window(datetime(2024, 1, 1, hour, 30)) is expected
+
+
+def test_prewarm_sleeps_to_stay_within_cpu_budget(monkeypatch):
+    tracks = [{'key': f'{i}:320', 'url': track_url(i), 'quality': '320'} for i in range(3)]
+    sleeps = []
+    sleep, caller = server.time.sleep, threading.current_thread()
+    monkeypatch.setattr(server, 'top_tracks', lambda n: tracks)
+    monkeypatch.setattr(server, 'in_prewarm_window', lambda now=None: True)
+    monkeypatch.setattr(server, 'prewarm_track', lambda track: (True, 0.5))  # Worker used 0.5 s of CPU
+    monkeypatch.setattr(server, 'PREWARM_CPU_BUDGET', 0.25)
+    # Only record this thread's sleeps - background threads keep sleeping for real
+    monkeypatch.setattr(server.time, 'sleep', lambda seconds: (
+        sleeps.append(seconds) if threading.current_thread() is caller else sleep(seconds)
+    ))
+
+    server.run_prewarm()
+
+    # 0.5 s of CPU at a 25% budget needs 2 s of wall time per track
+    assert sleeps == [pytest.approx(2.0, abs=0.1)] * len(tracks)
@@ -0,0 +1,86 @@
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import server
+from server import cancel_prefetch, foreground_work, start_prefetch
+
+TRACKS = [
+    {'title': f'Song {i}', 'artist': 'Band', 'duration': 200, 'url': f'https://open.spotify.com/track/{i:022d}'}
+    for i in range(5)
+]
+
+
+class Searches(list):
+    """Recorded (artist, title) calls; `gate` holds the stubbed search while cleared."""
+
+
+def wait_until(predicate, timeout=3):
+    end = time.monotonic() + timeout
+    while time.monotonic() < end:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+@pytest.fixture
+def searches(monkeypatch, tmp_path):
+    """Stub youtube_music_search and record its calls."""
+    calls = Searches()
+    calls.gate = gate = threading.Event()
+    gate.set()
+
+    def youtube_music_search(artist, title, duration=None):
+        calls.append((artist, title))
+        gate.wait(3)
+        return {'webpage_url': f'https://music.youtube.com/watch?v={len(calls):011d}', 'title': title, 'duration': duration}
+
+    monkeypatch.setattr(server, 'PREFETCH_ENABLED', True)
+    monkeypatch.setattr(server, 'PREFETCH_METADATA', False)
+    monkeypatch.setattr(server, 'PREFETCH_JOBS', {})
+    monkeypatch.setattr(server, 'MATCH_CACHE', {})
+    monkeypatch.setattr(server, 'IDENTITY_DB_PATH', str(tmp_path / 'identity.sqlite3'))
+    monkeypatch.setattr(server, 'IDENTITY_LOCAL', threading.local())
+    server.init_identity_db()
+    monkeypatch.setattr(server, 'youtube_music_search', youtube_music_search)
+    return calls
+
+
+def job_finished(collection_id):
+    return lambda: collection_id not in server.PREFETCH_JOBS
+
+
+def test_prefetched_matches_serve_preview_from_cache(searches):
+    assert start_prefetch('playlist1', TRACKS)
+    assert wait_until(job_finished('playlist1'))
+    assert len(searches) == len(TRACKS)
+
+    track = TRACKS[2]
+    response = server.app.test_client().post('/api/preview', json=track)
+    assert response.json['youtube_title'] == track['title']
+    assert len(searches) == len(TRACKS)  # No new search - the preview hit MATCH_CACHE
+
+
+def test_prefetch_waits_for_foreground_requests(searches):
+    with foreground_work():
+        start_prefetch('playlist2', TRACKS)
+        time.sleep(0.2)
+        assert searches == []
+    assert wait_until(job_finished('playlist2'))
+    assert len(searches) == len(TRACKS)
+
+
+def test_cancel_stops_the_job(searches):
+    searches.gate.clear()  # Hold the first search
+    start_prefetch('playlist3', TRACKS)
+    assert wait_until(lambda: len(searches) == 1)
+
+    assert cancel_prefetch('playlist3')
+    searches.gate.set()
+    assert wait_until(job_finished('playlist3'))
+    assert len(searches) == 1
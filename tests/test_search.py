@@ -0,0 +1,63 @@
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import server
+from server import youtube_music_search
+
+SLOW = 1.0  # Seconds a strategy takes when it should not be waited for
+
+
+def song(video_id, title='Song', artist='Band'):
+    return {'videoId': f'{video_id:0>11}', 'title': title, 'artists': [{'name': artist}], 'duration': '3:20'}
+
+
+@pytest.fixture
+def strategies(monkeypatch):
+    """Install the three strategies (real weights) answering with `results` after `delay` seconds."""
+    def install(songs, videos, search):
+        def strategy(name, weight, delay, results):
+            def search_fn(query):
+                time.sleep(delay)
+                return results
+            return {'name': name, 'weight': weight, 'search': search_fn}
+
+        monkeypatch.setattr(server, 'SEARCH_STRATEGIES', [
+            strategy('ytmusic-songs', 1.0, *songs),
+            strategy('ytmusic-videos', 0.85, *videos),
+            strategy('videos-search', 0.75, *search),
+        ])
+    return install
+
+
+def timed_search():
+    started = time.monotonic()
+    match = youtube_music_search('Band', 'Song', 200)
+    return match, time.monotonic() - started
+
+
+def test_confident_match_is_accepted_without_waiting(strategies):
+    strategies(songs=(0, [song('songs')]), videos=(SLOW, [song('videos')]), search=(SLOW, [song('search')]))
+    match, elapsed = timed_search()
+    assert match['webpage_url'].endswith('00000songs')
+    assert elapsed < SLOW / 2
+
+
+def test_lower_weighted_match_is_accepted_once_higher_strategies_answered(strategies):
+    # No valid song result, a perfect video (0.85 < threshold); videos-search can score at most 0.75
+    strategies(songs=(0, [song('songs', artist='Other')]), videos=(0.1, [song('videos')]), search=(SLOW, [song('search')]))
+    match, elapsed = timed_search()
+    assert match['webpage_url'].endswith('0000videos')
+    assert elapsed < SLOW / 2
+
+
+def test_higher_weighted_strategy_still_running_is_waited_for(strategies):
+    # The video arrives first, but ytmusic-songs could still beat it
+    strategies(songs=(0.3, [song('songs')]), videos=(0, [song('videos')]), search=(SLOW, []))
+    match, elapsed = timed_search()
+    assert match['webpage_url'].endswith('00000songs')
+    assert 0.3 <= elapsed < SLOW
+
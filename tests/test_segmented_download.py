@@ -0,0 +1,174 @@
+import os
+import subprocess
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import server
+from server import FFMPEG_PATH, download_audio, probe_mp3, segmented_download
+
+DURATION = 20  # Seconds of test tone
+
+
+class RangeServer(ThreadingHTTPServer):
+    """
+    Serves `files` by byte range, `delay` seconds per request.
+    `failures[(path, start)]` is the number of 503s before success (-1 = always).
+    """
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), RangeHandler)
+        self.files = {}
+        self.failures = {}
+        self.requests = []
+        self.delay = 0
+        self.lock = threading.Lock()
+
+    def url(self, path):
+        return f'http://127.0.0.1:{self.server_address[1]}{path}'
+
+
+class RangeHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        data = self.server.files[self.path]
+        start, end = (int(v) for v in self.headers['Range'].split('=')[1].split('-'))
+        with self.server.lock:
+            self.server.requests.append(start)
+            remaining = self.server.failures.get((self.path, start), 0)
+            if remaining > 0:
+                self.server.failures[(self.path, start)] = remaining - 1
+        time.sleep(self.server.delay)
+        if remaining:
+            self.send_response(503)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        body = data[start:end + 1]
+        self.send_response(206)
+        self.send_header('Content-Range', f'bytes {start}-{end}/{len(data)}')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def encode(tmp_path, name, codec):
+    path = tmp_path / name
+    subprocess.run(
+        [FFMPEG_PATH, '-loglevel', 'error', '-y', '-f', 'lavfi', '-i', f'sine=d={DURATION}',
+         '-c:a', codec, '-b:a', '64k', str(path)],
+        check=True
+    )
+    return path.read_bytes()
+
+
+@pytest.fixture(scope='module')
+def sources(tmp_path_factory):
+    tmp_path = tmp_path_factory.mktemp('sources')
+    return {
+        '/audio.webm': encode(tmp_path, 'audio.webm', 'libopus'),
+        '/audio.m4a': encode(tmp_path, 'audio.m4a', 'aac'),  # moov atom at the end
+    }
+
+
+@pytest.fixture
+def range_server(monkeypatch, sources):
+    httpd = RangeServer()
+    httpd.files.update(sources)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+
+    def resolve(path):
+        monkeypatch.setattr(server, 'resolve_audio_stream', lambda url: (httpd.url(path), {}, len(httpd.files[path])))
+
+    monkeypatch.setattr(server, 'SEGMENT_SIZE', 16 * 1024)
+    monkeypatch.setattr(server, 'SEGMENT_CONCURRENCY', 4)
+    monkeypatch.setattr(server, 'SEGMENT_RETRIES', 2)
+    httpd.resolve = resolve
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def assert_tone(path):
+    probe = probe_mp3(path)
+    assert probe is not None
+    assert abs(probe['duration_us'] / 1_000_000 - DURATION) < 0.2
+
+
+def test_downloads_and_transcodes_while_fetching(range_server, tmp_path):
+    range_server.resolve('/audio.webm')
+    output = tmp_path / 'track.mp3'
+    segmented_download('https://music.youtube.com/watch?v=abcdefghijk', str(output), '128')
+
+    assert_tone(str(output))
+    size = len(range_server.files['/audio.webm'])
+    assert sorted(range_server.requests) == list(range(0, size, 16 * 1024))
+    assert os.listdir(tmp_path) == ['track.mp3']  # .part removed
+
+
+def test_transient_errors_are_retried(range_server, tmp_path):
+    range_server.resolve('/audio.webm')
+    range_server.failures[('/audio.webm', 0)] = 2
+    range_server.failures[('/audio.webm', 5 * 16 * 1024)] = 1
+    output = tmp_path / 'track.mp3'
+    segmented_download('https://music.youtube.com/watch?v=abcdefghijk', str(output), '128')
+
+    assert_tone(str(output))
+    assert range_server.requests.count(0) == 3
+
+
+def test_unpipeable_container_is_transcoded_from_file(range_server, tmp_path):
+    range_server.resolve('/audio.m4a')
+    output = tmp_path / 'track.mp3'
+    segmented_download('https://music.youtube.com/watch?v=abcdefghijk', str(output), '128')
+
+    assert_tone(str(output))
+
+
+def test_failed_segment_cancels_the_rest(range_server, tmp_path, monkeypatch):
+    monkeypatch.setattr(server, 'SEGMENT_RETRIES', 0)
+    range_server.resolve('/audio.webm')
+    range_server.delay = 0.1
+    range_server.failures[('/audio.webm', 16 * 1024)] = -1
+    segments = len(range(0, len(range_server.files['/audio.webm']), 16 * 1024))
+
+    started = time.monotonic()
+    with pytest.raises(Exception):
+        segmented_download('https://music.youtube.com/watch?v=abcdefghijk', str(tmp_path / 'track.mp3'), '128')
+
+    assert time.monotonic() - started < 1
+    assert len(range_server.requests) <= 2 * server.SEGMENT_CONCURRENCY < segments  # Queued ones never ran
+    assert os.listdir(tmp_path) == []
+
+
+def test_download_audio_falls_back_to_ytdlp(range_server, tmp_path, monkeypatch):
+    range_server.resolve('/audio.webm')
+    range_server.failures[('/audio.webm', 0)] = -1
+    downloads = []
+
+    class FakeYoutubeDL:
+        def __init__(self, opts):
+            pass
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *args):
+            return False
+
+        def download(self, urls):
+            downloads.append((urls, os.listdir(tmp_path)))
+
+    monkeypatch.setattr(server, 'DOWNLOAD_ENGINE', 'segmented')
+    monkeypatch.setattr(server.yt_dlp, 'YoutubeDL', FakeYoutubeDL)
+    download_audio('https://music.youtube.com/watch?v=abcdefghijk', {}, str(tmp_path), 'track', '128')
+
+    assert downloads == [(['https://music.youtube.com/watch?v=abcdefghijk'], [])]
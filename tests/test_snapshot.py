@@ -0,0 +1,93 @@
+import itertools
+import os
+import struct
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import server
+from server import (
+    SNAPSHOT_MAGIC, cache_get, cache_put, export_snapshot, import_snapshot, resolve_identity,
+    save_snapshot, store_recording_match
+)
+
+SPOTIFY_ID = 'a' * 22
+MATCH = {'webpage_url': 'https://music.youtube.com/watch?v=abcdefghijk', 'title': 'Song', 'duration': 200}
+
+
+@pytest.fixture
+def state(monkeypatch, tmp_path):
+    """Empty caches, identity index, popularity and audio cache; returns a function that resets them."""
+    generation = itertools.count()
+
+    def reset():
+        monkeypatch.setattr(server, 'MATCH_CACHE', {})
+        monkeypatch.setattr(server, 'METADATA_CACHE', {})
+        monkeypatch.setattr(server, 'POPULARITY', {'sketch': server.CountMinSketch(), 'tracks': {}, 'decayed_at': 0})
+        monkeypatch.setattr(server, 'IDENTITY_DB_PATH', str(tmp_path / f'identity{next(generation)}.sqlite3'))
+        monkeypatch.setattr(server, 'IDENTITY_LOCAL', threading.local())
+        server.init_identity_db()
+
+    audio_dir = tmp_path / 'audio'
+    audio_dir.mkdir()
+    (audio_dir / 'abcdefghijk_320.mp3').write_bytes(b'mp3')
+    monkeypatch.setattr(server, 'AUDIO_CACHE_DIR', str(audio_dir))
+    monkeypatch.setattr(server, 'SNAPSHOT_PATH', str(tmp_path / 'cache.swsnap'))
+    monkeypatch.setattr(server, 'POPULARITY_DECAY_INTERVAL', 3600)
+    reset()
+    return reset
+
+
+def populate():
+    cache_put(server.MATCH_CACHE, ('band', 'song'), MATCH)
+    cache_put(server.METADATA_CACHE, 'https://open.spotify.com/track/' + SPOTIFY_ID, {'title': 'Song', 'artist': 'Band'})
+    recording_key, _ = resolve_identity(SPOTIFY_ID, 'USRC17607839')
+    store_recording_match(recording_key, MATCH)
+    server.record_popularity('https://open.spotify.com/track/' + SPOTIFY_ID, '320')
+
+
+def test_round_trip(state):
+    populate()
+    archive = export_snapshot()
+    state()
+
+    hot_audio = import_snapshot(archive)
+    assert cache_get(server.MATCH_CACHE, ('band', 'song')) == MATCH
+    assert cache_get(server.METADATA_CACHE, 'https://open.spotify.com/track/' + SPOTIFY_ID)['artist'] == 'Band'
+    assert resolve_identity(SPOTIFY_ID) == ('isrc:USRC17607839', MATCH)
+    assert server.top_tracks(1)[0]['key'] == f'{SPOTIFY_ID}:320'
+    assert [(entry['video_id'], entry['quality']) for entry in hot_audio] == [('abcdefghijk', '320')]
+
+
+def test_checksum_mismatch_is_rejected(state):
+    populate()
+    archive = bytearray(export_snapshot())
+    archive[-1] ^= 0xFF
+    state()
+
+    with pytest.raises(ValueError, match='checksum'):
+        import_snapshot(bytes(archive))
+    assert server.MATCH_CACHE == {}
+
+
+def test_other_version_is_rejected(state):
+    populate()
+    archive = export_snapshot()
+    header = len(SNAPSHOT_MAGIC)
+    archive = archive[:header] + struct.pack('>H', server.SNAPSHOT_VERSION + 1) + archive[header + 2:]
+    state()
+
+    with pytest.raises(ValueError, match='version'):
+        import_snapshot(archive)
+    assert server.MATCH_CACHE == {}
+
+
+def test_save_leaves_no_temp_files(state, tmp_path):
+    populate()
+    save_snapshot()
+
+    assert sorted(p.name for p in tmp_path.iterdir() if 'swsnap' in p.name) == ['cache.swsnap']
+    with open(server.SNAPSHOT_PATH, 'rb') as f:
+        import_snapshot(f.read())